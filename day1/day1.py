@@ -1,16 +1,15 @@
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session
 
 st.title(":material/vpn_key: Day 1: Connect to Snowflake")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Query Snowflake version
 version = session.sql("SELECT CURRENT_VERSION()").collect()[0][0]
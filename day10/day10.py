@@ -1,28 +1,18 @@
 import streamlit as st
-import json
-from snowflake.snowpark.functions import ai_complete
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import complete
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 def call_llm(prompt_text: str) -> str:
     """Call Snowflake Cortex LLM."""
-    df = session.range(1).select(
-        ai_complete(model="claude-3-5-sonnet", prompt=prompt_text).alias("response")
-    )
-    response_raw = df.collect()[0][0]
-    response_json = json.loads(response_raw)
-    # Extract text from response
-    if isinstance(response_json, dict):
-        return response_json.get("choices", [{}])[0].get("messages", "")
-    return str(response_json)
+    return complete(session, prompt_text, model="claude-3-5-sonnet")
 
 st.title(":material/chat: My First Chatbot")
 
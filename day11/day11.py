@@ -1,48 +1,46 @@
 import streamlit as st
-import json
-from snowflake.snowpark.functions import ai_complete
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import complete
+from shared.memory import ConversationMemory
+from shared.session import get_session
+from shared.transcript import Transcript
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 def call_llm(prompt_text: str) -> str:
     """Call Snowflake Cortex LLM."""
-    df = session.range(1).select(
-        ai_complete(model="claude-3-5-sonnet", prompt=prompt_text).alias("response")
-    )
-    response_raw = df.collect()[0][0]
-    response_json = json.loads(response_raw)
-    if isinstance(response_json, dict):
-        return response_json.get("choices", [{}])[0].get("messages", "")
-    return str(response_json)
+    return complete(session, prompt_text, model="claude-3-5-sonnet")
 
 st.title(":material/chat: Chatbot with History")
 
 # Initialize messages
 if "messages" not in st.session_state:
-    st.session_state.messages = [
+    st.session_state.messages = Transcript([
         {"role": "assistant", "content": "Hello! I'm your AI assistant. How can I help you today?"}
-    ]
+    ])
+
+# Conversation memory: recent turns verbatim, older ones summarized
+if "memory" not in st.session_state:
+    st.session_state.memory = ConversationMemory(model="claude-3-5-sonnet")
 
 # Sidebar to show conversation stats
 with st.sidebar:
     st.header("Conversation Stats")
-    user_msgs = len([m for m in st.session_state.messages if m["role"] == "user"])
-    assistant_msgs = len([m for m in st.session_state.messages if m["role"] == "assistant"])
-    st.metric("Your Messages", user_msgs)
-    st.metric("AI Responses", assistant_msgs)
+    st.metric("Your Messages", st.session_state.messages.count("user"))
+    st.metric("AI Responses", st.session_state.messages.count("assistant"))
+    if st.session_state.memory.summarized:
+        st.caption(f"{st.session_state.memory.summarized} earlier messages are summarized to keep prompts short")
     
     if st.button("Clear History"):
-        st.session_state.messages = [
+        st.session_state.memory.reset()
+        st.session_state.messages = Transcript([
             {"role": "assistant", "content": "Hello! I'm your AI assistant. How can I help you today?"}
-        ]
+        ])
         st.rerun()
 
 # Display all messages from history
@@ -60,11 +58,8 @@ if prompt := st.chat_input("Type your message..."):
     # Generate and display assistant response
     with st.chat_message("assistant"):
         with st.spinner("Thinking..."):
-            # Build the full conversation history for context
-            conversation = "\n\n".join([
-                f"{'User' if msg['role'] == 'user' else 'Assistant'}: {msg['content']}"
-                for msg in st.session_state.messages
-            ])
+            # Recent history plus a summary of older turns, within a token budget
+            conversation = st.session_state.memory.context(session, st.session_state.messages)
             full_prompt = f"{conversation}\n\nAssistant:"
             
             response = call_llm(full_prompt)
@@ -1,62 +1,55 @@
 import streamlit as st
-import time
-import json
-from snowflake.snowpark.functions import ai_complete
+from dataclasses import asdict
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.arena import run_models
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Session state initialization
 if "latest_results" not in st.session_state:
     st.session_state.latest_results = None
 
-def run_model(model: str, prompt: str) -> dict:
-    """Execute model and collect metrics."""
-    start = time.time()
-
-    # Call Cortex Complete function
-    df = session.range(1).select(
-        ai_complete(model=model, prompt=prompt).alias("response")
-    )
-
-    # Get response from dataframe
-    rows = df.collect()
-    response_raw = rows[0][0]
-    response_json = json.loads(response_raw)
-
-    # Extract text from response
-    text = response_json.get("choices", [{}])[0].get("messages", "") if isinstance(response_json, dict) else str(response_json)
-
-    latency = time.time() - start
-    tokens = int(len(text.split()) * 4/3)  # Estimate tokens (1 token ≈ 0.75 words)
-
-    return {
-        "latency": latency,
-        "tokens": tokens,
-        "response_text": text
-    }
-
-def display_metrics(results: dict, model_key: str):
+def display_metrics(result: dict):
     """Display metrics for a model."""
-    latency_col, tokens_col = st.columns(2)  # Create 2 equal columns
-
-    latency_col.metric("Latency (s)", f"{results[model_key]['latency']:.1f}")  # 1 decimal for seconds
-    tokens_col.metric("Tokens", results[model_key]['tokens'])
-
-def display_response(container, results: dict, model_key: str):
+    ttft_col, latency_col = st.columns(2)  # Create 2 equal columns
+    tokens_col, speed_col = st.columns(2)
+
+    ttft = result["ttft"]
+    ttft_col.metric("TTFT (s)", f"{ttft:.1f}" if ttft is not None else "—")
+    latency_col.metric("Latency (s)", f"{result['total_time']:.1f}")  # 1 decimal for seconds
+    # Counts not reported by Cortex come from a local tokenizer or heuristic, so mark them as approximate
+    suffix = "" if result["token_source"] == "reported" else " (est.)"
+    tokens_col.metric(f"Tokens{suffix}", result["completion_tokens"])
+    speed_col.metric(f"Tokens/s{suffix}", f"{result['tokens_per_second']:.1f}")
+    st.caption(f"Prompt: {result['prompt_tokens']} tokens · Counts {result['token_source']}")
+    if result["queue_time"] >= 0.1:
+        st.caption(f"Queued for {result['queue_time']:.1f}s before starting")
+
+def display_response(container, prompt: str, result: dict):
     """Display chat messages in container."""
     with container:
         with st.chat_message("user"):
-            st.write(results["prompt"])
+            st.write(prompt)
         with st.chat_message("assistant"):
-            st.write(results[model_key]["response_text"])
+            if result["error"]:
+                st.error(result["error"])
+            else:
+                st.write(result["response_text"])
+
+def display_placeholder_metrics():
+    """Show placeholders when no results yet."""
+    ttft_col, latency_col = st.columns(2)
+    tokens_col, speed_col = st.columns(2)
+    ttft_col.metric("TTFT (s)", "—")
+    latency_col.metric("Latency (s)", "—")
+    tokens_col.metric("Tokens", "—")
+    speed_col.metric("Tokens/s", "—")
 
 # Model selection
 llm_models = [
@@ -70,48 +63,67 @@ llm_models = [
     "openai-gpt-5-mini"
 ]
 st.title(":material/compare: Select Models")
-col_a, col_b = st.columns(2)  # Create two columns for side-by-side dropdowns
-
-col_a.write("**Model A**")
-model_a = col_a.selectbox("Model A", llm_models, key="model_a", label_visibility="collapsed")
-
-col_b.write("**Model B**")
-model_b = col_b.selectbox("Model B", llm_models, key="model_b", index=1, label_visibility="collapsed")  # Default to second model
-
-# Response containers
+models = st.multiselect(
+    "Models to compare",
+    llm_models,
+    default=llm_models[:2],
+    max_selections=8,
+    label_visibility="collapsed"
+)
+stream_responses = st.toggle(
+    "Stream responses",
+    value=True,
+    help="Streaming measures time to first token; turn it off to get exact token usage reported by Cortex"
+)
+
+# Chat input (pinned to the bottom of the page)
+prompt = st.chat_input("Enter your message to compare models")  # All selected models run at once
+
+# Response containers, up to 4 per row
 st.divider()
-col_a, col_b = st.columns(2)  # Create two columns for side-by-side responses
 results = st.session_state.latest_results
-
-# Loop through both models to avoid code duplication
-for col, model_name, model_key in [(col_a, model_a, "model_a"), (col_b, model_b, "model_b")]:
-    with col:
-        st.subheader(model_name)
-        container = st.container(height=400, border=True)  # Fixed height, scrollable container
-
-        if results:
-            display_response(container, results, model_key)
-
-        st.caption("Performance Metrics")
-        if results:
-            display_metrics(results, model_key)
-        else:  # Show placeholders when no results yet
-            latency_col, tokens_col = st.columns(2)
-            latency_col.metric("Latency (s)", "—")
-            tokens_col.metric("Tokens", "—")
-
-# Chat input and execution
-st.divider()
-if prompt := st.chat_input("Enter your message to compare models"):  # Walrus operator: assign and check
-    # Run models sequentially (Model A, then Model B)
-    with st.status(f"Running {model_a}..."):
-        result_a = run_model(model_a, prompt)
-    with st.status(f"Running {model_b}..."):
-        result_b = run_model(model_b, prompt)
+slots = {}
+for row_start in range(0, len(models), 4):
+    row_models = models[row_start:row_start + 4]
+    for col, model_name in zip(st.columns(4), row_models):
+        with col:
+            st.subheader(model_name)
+            container = st.container(height=400, border=True)  # Fixed height, scrollable container
+            body = container.empty()  # Replaced when this model's answer arrives
+            st.caption("Performance Metrics")
+            metrics = st.empty()
+            slots[model_name] = (body, metrics)
+
+            if prompt:
+                body.caption(":material/hourglass_top: Waiting for response...")
+                with metrics.container():
+                    display_placeholder_metrics()
+            elif results and model_name in results["runs"]:
+                display_response(body.container(), results["prompt"], results["runs"][model_name])
+                with metrics.container():
+                    display_metrics(results["runs"][model_name])
+            else:
+                with metrics.container():
+                    display_placeholder_metrics()
+
+# Run all selected models concurrently and fill each column as it finishes
+if prompt and models:
+    runs = {}
+    with st.status(f"Running {len(models)} model(s)...") as status:
+        for run in run_models(session, models, prompt, stream=stream_responses):
+            result = asdict(run)
+            runs[run.model] = result
+
+            body, metrics = slots[run.model]
+            display_response(body.container(), prompt, result)
+            with metrics.container():
+                display_metrics(result)
+
+            st.write(f":material/check_circle: {run.model} finished in {run.total_time:.1f}s")
+        status.update(label="All models finished", state="complete")
 
     # Store results in session state (replaces previous results)
-    st.session_state.latest_results = {"prompt": prompt, "model_a": result_a, "model_b": result_b}
-    st.rerun()  # Trigger rerun to display results
+    st.session_state.latest_results = {"prompt": prompt, "runs": runs}
 
 st.divider()
-st.caption("Day 15: Model Comparison Arena | 30 Days of AI")
\ No newline at end of file
+st.caption("Day 15: Model Comparison Arena | 30 Days of AI")
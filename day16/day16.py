@@ -1,19 +1,18 @@
 import streamlit as st
-from pypdf import PdfReader
-import io
 import pandas as pd
 from datetime import datetime
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.extract import extract_files
+from shared.loader import DEFAULT_BATCH_SIZE, content_hash, merge_rows
+from shared.manifest import load_manifest, table_fingerprint
+from shared.session import get_session
 
-# Establish Snowflake connection
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 st.title(":material/description: Batch Document Text Extractor")
 st.write("Upload multiple documents at once to extract text and save to Snowflake for RAG applications.")
@@ -85,20 +84,10 @@ with st.container(border=True):
         help="Supported formats: TXT, MD, PDF. Upload multiple files at once!"
 )
 
-    # Check if table exists to set default replace_mode value
-    table_exists = False
-    try:
-        check_result = session.sql(f"""
-            SELECT COUNT(*) as CNT FROM {st.session_state.database}.{st.session_state.schema}.{st.session_state.table_name}
-        """).collect()
-        table_exists = True  # Table exists if query succeeds
-    except:
-        table_exists = False  # Table doesn't exist
-    
-    # Set checkbox value based on table existence
+    # Off by default: documents are upserted by file name, so unchanged ones can stay
     replace_mode = st.checkbox(
         f":material/sync: Replace Table Mode for `{st.session_state.table_name}`",
-        value=table_exists,  # True if table exists, False if it doesn't
+        value=False,
         help=f"When enabled, clears all existing data in {st.session_state.database}.{st.session_state.schema}.{st.session_state.table_name} before saving new documents"
     )
     
@@ -106,6 +95,22 @@ with st.container(border=True):
         st.warning(f":material/warning: **Replace Mode Enabled** - All existing documents in `{st.session_state.table_name}` will be deleted before saving new ones.")
     else:
         st.info(f":material/add: **Append Mode** - New documents will be added to `{st.session_state.table_name}`.")
+    
+    batch_size = st.number_input(
+        "Load batch size",
+        min_value=100,
+        max_value=100000,
+        value=DEFAULT_BATCH_SIZE,
+        step=1000,
+        help="Number of documents sent to Snowflake per bulk load"
+    )
+    extract_timeout = st.number_input(
+        "Extraction timeout per file (seconds)",
+        min_value=10,
+        max_value=3600,
+        value=120,
+        help="Files that take longer are skipped so one malformed PDF can't stall the batch"
+    )
 
 # Get values from session state for use in the rest of the code
 database = st.session_state.database
@@ -141,171 +146,171 @@ if uploaded_files:
         )
     
     if process_button:
-        # Initialize progress tracking
-        success_count = 0
-        error_count = 0
-        extracted_data = []
+        # Only counters and a few short previews are kept; document text goes straight to Snowflake
+        counts = {"success": 0, "error": 0, "skipped": 0, "words": 0}
+        previews = []
+        loaded_hashes = {}  # File name -> content hash, for files queued for extraction
+        full_table_name = f"{database}.{schema}.{table_name}"
         
-        progress_bar = st.progress(0, text="Starting extraction...")
-        status_container = st.empty()
+        def changed_files(manifest):
+            """Yield uploads whose content differs from what was last loaded."""
+            for f in uploaded_files:
+                # Each upload is read only when it is handed to the extraction pool
+                data = f.getvalue()
+                file_hash = content_hash(data)
+                if f.name in loaded_hashes or manifest.is_unchanged(f.name, file_hash):
+                    # Unchanged since the last load, or a duplicate name in this upload
+                    counts["skipped"] += 1
+                    continue
+                loaded_hashes[f.name] = file_hash
+                yield f.name, data
         
-        for idx, uploaded_file in enumerate(uploaded_files):
-            progress_pct = (idx + 1) / len(uploaded_files)
-            progress_bar.progress(progress_pct, text=f"Processing {idx+1}/{len(uploaded_files)}: {uploaded_file.name}")
-            
+        def document_rows(manifest, progress_bar, status_container):
+            """Extract changed uploads in order and yield one table row per document."""
+            for result in extract_files(changed_files(manifest), timeout=extract_timeout):
+                done = min(counts["skipped"] + result.index + 1, len(uploaded_files))
+                progress_bar.progress(done / len(uploaded_files), text=f"Processing {done}/{len(uploaded_files)}: {result.file_name}")
+                
+                if result.error:
+                    counts["error"] += 1
+                    loaded_hashes.pop(result.file_name)
+                    status_container.error(f":material/cancel: Error processing {result.file_name}: {result.error}")
+                    continue
+                if not result.text.strip():
+                    counts["error"] += 1
+                    loaded_hashes.pop(result.file_name)
+                    status_container.warning(f":material/warning: No text extracted from: {result.file_name}")
+                    continue
+                
+                word_count = len(result.text.split())
+                counts["success"] += 1
+                counts["words"] += word_count
+                if len(previews) < 3:
+                    preview_text = result.text[:200]
+                    if len(result.text) > 200:
+                        preview_text += "..."
+                    previews.append((result.file_name, word_count, preview_text))
+                
+                yield {
+                    "FILE_NAME": result.file_name,
+                    "FILE_TYPE": result.file_type,
+                    "FILE_SIZE": result.file_size,
+                    "EXTRACTED_TEXT": result.text,
+                    "WORD_COUNT": word_count,
+                    "CHAR_COUNT": len(result.text),
+                    "CONTENT_HASH": loaded_hashes[result.file_name]
+                }
+        
+        # Extract and save to Snowflake in one streaming pass
+        with st.status("Saving to Snowflake...", expanded=True) as status:
             try:
-                # Determine file type from extension
-                if uploaded_file.name.lower().endswith('.txt'):
-                    file_type = "TXT"
-                elif uploaded_file.name.lower().endswith('.md'):
-                    file_type = "Markdown"
-                elif uploaded_file.name.lower().endswith('.pdf'):
-                    file_type = "PDF"
-                else:
-                    file_type = "Unknown"
+                # Ensure database and schema exist
+                st.write(":material/looks_one: Setting up database structure...")
+                session.sql(f"CREATE DATABASE IF NOT EXISTS {database}").collect()
+                session.sql(f"CREATE SCHEMA IF NOT EXISTS {database}.{schema}").collect()
                 
-                # Reset file pointer
-                uploaded_file.seek(0)
+                # Create table if it doesn't exist
+                st.write(":material/looks_two: Creating table if needed...")
+                create_table_sql = f"""
+                CREATE TABLE IF NOT EXISTS {full_table_name} (
+                    DOC_ID NUMBER AUTOINCREMENT,
+                    FILE_NAME VARCHAR,
+                    FILE_TYPE VARCHAR,
+                    FILE_SIZE NUMBER,
+                    EXTRACTED_TEXT VARCHAR,
+                    UPLOAD_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+                    WORD_COUNT NUMBER,
+                    CHAR_COUNT NUMBER,
+                    CONTENT_HASH VARCHAR
+                )
+                """
+                session.sql(create_table_sql).collect()
+                # Tables created before content hashing was added
+                if not session.sql(f"SHOW COLUMNS LIKE 'CONTENT_HASH' IN TABLE {full_table_name}").collect():
+                    session.sql(f"ALTER TABLE {full_table_name} ADD COLUMN IF NOT EXISTS CONTENT_HASH VARCHAR").collect()
+                    # Uploads used to be appended blindly; keep the first copy of each file, since saving now merges by file name
+                    session.sql(f"""
+                    DELETE FROM {full_table_name}
+                    WHERE DOC_ID NOT IN (SELECT MIN(DOC_ID) FROM {full_table_name} GROUP BY FILE_NAME)
+                    """).collect()
+                manifest = load_manifest(session, full_table_name)
                 
-                # Extract text based on file type
-                extracted_text = ""
+                # Replace mode: clear existing data
+                if replace_mode:
+                    st.write(":material/sync: Replace mode: Clearing existing data...")
+                    try:
+                        session.sql(f"TRUNCATE TABLE {full_table_name}").collect()
+                        manifest.clear()
+                        st.write("   :material/check_circle: Existing data cleared")
+                    except Exception as e:
+                        st.write(f"   :material/warning: No existing data to clear")
                 
-                if uploaded_file.name.lower().endswith(('.txt', '.md')):
-                    # Handle TXT and Markdown files
-                    extracted_text = uploaded_file.read().decode("utf-8")
+                # Extract changed files in parallel, stage them in bounded batches, then upsert by file name
+                st.write(f":material/looks_3: Extracting and loading {len(uploaded_files)} file(s)...")
+                progress_bar = st.progress(0, text="Starting extraction...")
+                status_container = st.empty()
+                saved_caption = st.empty()
                 
-                elif uploaded_file.name.lower().endswith('.pdf'):
-                    # Handle PDF files
-                    pdf_reader = PdfReader(io.BytesIO(uploaded_file.read()))
-                    
-                    # Extract text from all pages
-                    for page in pdf_reader.pages:
-                        page_text = page.extract_text()
-                        if page_text:
-                            extracted_text += page_text + "\n\n"
+                inserted, updated = merge_rows(
+                    session,
+                    document_rows(manifest, progress_bar, status_container),
+                    full_table_name,
+                    key_columns=["FILE_NAME"],
+                    columns=["FILE_NAME", "FILE_TYPE", "FILE_SIZE", "EXTRACTED_TEXT", "WORD_COUNT", "CHAR_COUNT", "CONTENT_HASH"],
+                    touch_column="UPLOAD_TIMESTAMP",
+                    batch_size=batch_size,
+                    on_batch=lambda n: saved_caption.caption(f"Staged {n} document(s)")
+                )
+                saved_count = inserted + updated
+                manifest.update(loaded_hashes, table_fingerprint(session, full_table_name))
+                progress_bar.empty()
                 
-                # Check if extraction was successful
-                if extracted_text and extracted_text.strip():
-                    # Calculate metadata
-                    word_count = len(extracted_text.split())
-                    char_count = len(extracted_text)
-                    
-                    # Store extracted data
-                    extracted_data.append({
-                        'file_name': uploaded_file.name,
-                        'file_type': file_type,
-                        'file_size': uploaded_file.size,
-                        'extracted_text': extracted_text,
-                        'word_count': word_count,
-                        'char_count': char_count
-                    })
-                    
-                    success_count += 1
-                else:
-                    error_count += 1
-                    status_container.warning(f":material/warning: No text extracted from: {uploaded_file.name}")
-                    
+                status.update(label=":material/check_circle: All documents saved!", state="complete", expanded=False)
             except Exception as e:
-                error_count += 1
-                status_container.error(f":material/cancel: Error processing {uploaded_file.name}: {str(e)}")
-        
-        progress_bar.empty()
-        status_container.empty()
+                saved_count = 0
+                status.update(label="Saving failed", state="error")
+                st.error(f"Error saving to Snowflake: {str(e)}")
         
         # Display results
         with st.container(border=True):
             st.subheader(":material/analytics: Documents Written to a Database Table")
             
-            col1, col2, col3 = st.columns(3)
+            col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric(":material/check_circle: Successful", success_count)
+                st.metric(":material/check_circle: Successful", counts["success"])
             with col2:
-                st.metric(":material/cancel: Failed", error_count)
+                st.metric(":material/skip_next: Unchanged", counts["skipped"])
             with col3:
-                st.metric(":material/analytics: Total Words", f"{sum(d['word_count'] for d in extracted_data):,}")
+                st.metric(":material/cancel: Failed", counts["error"])
+            with col4:
+                st.metric(":material/analytics: Total Words", f"{counts['words']:,}")
             
-            # Store in session state for review
-            if extracted_data:
-                st.session_state.extracted_data = extracted_data
-                st.success(f":material/check_circle: Successfully extracted text from {success_count} file(s)!")
+            if saved_count:
+                st.success(f":material/check_circle: Successfully extracted text from {counts['success']} file(s)!")
                 
                 # Preview extracted data
                 with st.expander(":material/visibility: Preview First 3 Files"):
-                    for data in extracted_data[:3]:
+                    for file_name, word_count, preview_text in previews:
                         with st.container(border=True):
-                            st.markdown(f"**{data['file_name']}**")
-                            st.caption(f"{data['word_count']:,} words")
-                            preview_text = data['extracted_text'][:200]
-                            if len(data['extracted_text']) > 200:
-                                preview_text += "..."
+                            st.markdown(f"**{file_name}**")
+                            st.caption(f"{word_count:,} words")
                             st.text(preview_text)
                     
-                    if len(extracted_data) > 3:
-                        st.caption(f"... and {len(extracted_data) - 3} more")
+                    if counts["success"] > 3:
+                        st.caption(f"... and {counts['success'] - 3} more")
                 
-                # Save to Snowflake
-                with st.status("Saving to Snowflake...", expanded=True) as status:
-                    try:
-                        # Ensure database and schema exist
-                        st.write(":material/looks_one: Setting up database structure...")
-                        session.sql(f"CREATE DATABASE IF NOT EXISTS {database}").collect()
-                        session.sql(f"CREATE SCHEMA IF NOT EXISTS {database}.{schema}").collect()
-                        
-                        # Create table if it doesn't exist
-                        st.write(":material/looks_two: Creating table if needed...")
-                        create_table_sql = f"""
-                        CREATE TABLE IF NOT EXISTS {database}.{schema}.{table_name} (
-                            DOC_ID NUMBER AUTOINCREMENT,
-                            FILE_NAME VARCHAR,
-                            FILE_TYPE VARCHAR,
-                            FILE_SIZE NUMBER,
-                            EXTRACTED_TEXT VARCHAR,
-                            UPLOAD_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
-                            WORD_COUNT NUMBER,
-                            CHAR_COUNT NUMBER
-                        )
-                        """
-                        session.sql(create_table_sql).collect()
-                        
-                        # Replace mode: clear existing data
-                        if replace_mode:
-                            st.write(":material/sync: Replace mode: Clearing existing data...")
-                            try:
-                                session.sql(f"TRUNCATE TABLE {database}.{schema}.{table_name}").collect()
-                                st.write("   :material/check_circle: Existing data cleared")
-                            except Exception as e:
-                                st.write(f"   :material/warning: No existing data to clear")
-                        
-                        # Insert all extracted data
-                        st.write(f":material/looks_3: Inserting {len(extracted_data)} document(s)...")
-                        
-                        for idx, data in enumerate(extracted_data, 1):
-                            st.caption(f"Saving {idx}/{len(extracted_data)}: {data['file_name']}")
-                            # Escape single quotes in text
-                            safe_text = data['extracted_text'].replace("'", "''")
-                            insert_sql = f"""
-                            INSERT INTO {database}.{schema}.{table_name}
-                            (FILE_NAME, FILE_TYPE, FILE_SIZE, EXTRACTED_TEXT, WORD_COUNT, CHAR_COUNT)
-                            VALUES ('{data['file_name']}', '{data['file_type']}', {data['file_size']}, 
-                                    '{safe_text}', {data['word_count']}, {data['char_count']})
-                            """
-                            session.sql(insert_sql).collect()
-                        
-                        status.update(label=":material/check_circle: All documents saved!", state="complete", expanded=False)
-                        
-                        mode_msg = "replaced in" if replace_mode else "saved to"
-                        st.success(f":material/check_circle: Successfully {mode_msg} `{database}.{schema}.{table_name}`\n\n:material/description: {len(extracted_data)} document(s) now in table")
-                        
-                        # Store references in session state for downstream apps
-                        st.session_state.rag_source_table = f"{database}.{schema}.{table_name}"
-                        st.session_state.rag_source_database = database
-                        st.session_state.rag_source_schema = schema
-                        
-                        st.balloons()
-                        
-                    except Exception as e:
-                        st.error(f"Error saving to Snowflake: {str(e)}")
-            else:
+                mode_msg = "replaced in" if replace_mode else "saved to"
+                st.success(f":material/check_circle: Successfully {mode_msg} `{full_table_name}`\n\n:material/description: {inserted} new and {updated} changed document(s)")
+                
+                # Store references in session state for downstream apps
+                st.session_state.rag_source_table = full_table_name
+                st.session_state.rag_source_database = database
+                st.session_state.rag_source_schema = schema
+                
+                st.balloons()
+            elif counts["skipped"] == len(uploaded_files):
+                st.info(":material/check_circle: All files are unchanged since the last load - nothing to update.")
+            elif counts["success"] == 0:
                 st.warning("No text was successfully extracted from any file.")
 
 st.divider()
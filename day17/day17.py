@@ -1,16 +1,35 @@
 import streamlit as st
-import pandas as pd
 import re
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.chunking import chunk_documents, chunk_in_snowflake, chunk_params, ensure_chunk_table, save_chunks, unchunked_condition
+from shared.hybrid import get_hybrid_retriever
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
+
+def load_reviews(source_table, chunk_table=None, params=None):
+    """Load reviews; with a chunk table, only those without live chunks for their current content (made with ``params``, if given)."""
+    query = f"""
+    SELECT 
+        DOC_ID,
+        FILE_NAME,
+        FILE_TYPE,
+        EXTRACTED_TEXT,
+        UPLOAD_TIMESTAMP,
+        WORD_COUNT,
+        CHAR_COUNT,
+        CONTENT_HASH
+    FROM {source_table} d
+    """
+    if chunk_table:
+        query += f"WHERE {unchunked_condition(chunk_table, match_params=params is not None)}\n"
+    query += "ORDER BY FILE_NAME"
+    return session.sql(query, params=[params] if params is not None else None).to_pandas()
 
 st.title(":material/sync: Prepare and Chunk Data for RAG")
 st.write("Load customer reviews from Day 16, process them, and prepare searchable chunks for RAG.")
@@ -61,6 +80,12 @@ with st.container(border=True):
     # Check for existing loaded data
     if 'loaded_data' in st.session_state:
         st.success(f":material/check_circle: **{len(st.session_state.loaded_data)} document(s)** already loaded")
+    
+    changed_only = st.checkbox(
+        ":material/difference: Only new or changed documents",
+        value=True,
+        help="Skip documents whose current content already has chunks in the chunk table. Chunk IDs are stable, so unchanged reviews keep their chunks and embeddings either way"
+    )
 
     # Load documents button
     if st.button(":material/folder_open: Load Reviews", type="primary", use_container_width=True):
@@ -68,25 +93,28 @@ with st.container(border=True):
             with st.status("Loading reviews from Snowflake...", expanded=True) as status:
                 st.write(":material/wifi: Querying database...")
                 
-                query = f"""
-                SELECT 
-                    DOC_ID,
-                    FILE_NAME,
-                    FILE_TYPE,
-                    EXTRACTED_TEXT,
-                    UPLOAD_TIMESTAMP,
-                    WORD_COUNT,
-                    CHAR_COUNT
-                FROM {st.session_state.day17_database}.{st.session_state.day17_schema}.{st.session_state.day17_table_name}
-                ORDER BY FILE_NAME
-                """
-                df = session.sql(query).to_pandas()
+                source_table = f"{st.session_state.day17_database}.{st.session_state.day17_schema}.{st.session_state.day17_table_name}"
+                chunk_table = f"{st.session_state.day17_database}.{st.session_state.day17_schema}.{st.session_state.day17_chunk_table}"
                 
-                st.write(f":material/check_circle: Loaded {len(df)} review(s)")
+                # Only documents whose current content hasn't been chunked yet
+                incremental = False
+                if changed_only:
+                    try:
+                        session.sql(f"SELECT DOC_ID, CONTENT_HASH, IS_DELETED FROM {chunk_table} LIMIT 0").collect()
+                        # Older chunk tables don't record the chunking parameters yet
+                        ensure_chunk_table(session, chunk_table)
+                        incremental = True
+                    except:
+                        st.write(":material/info: No chunk table with content hashes yet - loading all documents")
+                df = load_reviews(source_table, chunk_table if incremental else None)
+                
+                st.write(f":material/check_circle: Loaded {len(df)} {'new or changed ' if incremental else ''}review(s)")
                 status.update(label="Reviews loaded successfully!", state="complete", expanded=False)
                 
                 # Store in session state
                 st.session_state.loaded_data = df
+                st.session_state.loaded_incremental = incremental
+                st.session_state.loaded_chunk_table = chunk_table
                 st.session_state.source_table = f"{st.session_state.day17_database}.{st.session_state.day17_schema}.{st.session_state.day17_table_name}"
                 st.rerun()
                 
@@ -94,6 +122,57 @@ with st.container(border=True):
             st.error(f"Error loading reviews: {str(e)}")
             st.info(":material/lightbulb: Make sure you've uploaded review files in Day 16 first!")
 
+# Server-side chunking: documents never leave Snowflake
+with st.container(border=True):
+    st.subheader(":material/cloud_sync: Chunk Inside Snowflake")
+    st.write("Skip loading reviews into the app: a temporary Python UDTF splits them and a single `MERGE` writes the chunks.")
+    
+    server_source_table = f"{st.session_state.day17_database}.{st.session_state.day17_schema}.{st.session_state.day17_table_name}"
+    server_chunk_table = f"{st.session_state.day17_database}.{st.session_state.day17_schema}.{st.session_state.day17_chunk_table}"
+    
+    server_keep_whole = st.checkbox("Keep each review as a single chunk", value=True, key="day17_server_keep_whole")
+    if not server_keep_whole:
+        col1, col2 = st.columns(2)
+        with col1:
+            server_chunk_size = st.slider("Chunk Size (words):", min_value=50, max_value=500, value=200, step=50, key="day17_server_chunk_size")
+        with col2:
+            # Overlap must stay below the chunk size
+            server_max_overlap = min(100, server_chunk_size - 10)
+            if st.session_state.get("day17_server_overlap", 0) > server_max_overlap:
+                st.session_state.day17_server_overlap = server_max_overlap
+            server_overlap = st.slider("Overlap (words):", min_value=0, max_value=server_max_overlap, value=min(50, server_max_overlap), step=10, key="day17_server_overlap")
+    st.caption(f":material/arrow_forward: `{server_source_table}` → `{server_chunk_table}`" + (" (new or changed documents only)" if changed_only else " (all documents, outdated chunks are tombstoned)"))
+    
+    if st.button(":material/cloud_sync: Chunk in Snowflake", use_container_width=True):
+        try:
+            with st.status("Chunking in Snowflake...", expanded=True) as status:
+                st.write(":material/looks_one: Preparing chunk table...")
+                ensure_chunk_table(session, server_chunk_table)
+                
+                st.write(":material/looks_two: Splitting reviews with a UDTF...")
+                inserted, restored, tombstoned = chunk_in_snowflake(
+                    session,
+                    server_source_table,
+                    server_chunk_table,
+                    chunk_size=None if server_keep_whole else server_chunk_size,
+                    overlap=0 if server_keep_whole else server_overlap,
+                    incremental=changed_only
+                )
+                status.update(label=":material/check_circle: Chunking complete!", state="complete", expanded=False)
+            
+            st.success(f":material/check_circle: Inserted {inserted} chunk(s) into `{server_chunk_table}`")
+            st.caption(f"{restored} restored, {tombstoned} tombstoned")
+            
+            # Store for Day 18
+            st.session_state.chunks_table = server_chunk_table
+            st.session_state.chunks_database = st.session_state.day17_database
+            st.session_state.chunks_schema = st.session_state.day17_schema
+            st.session_state.chunk_table_saved = True
+            # Rebuild the hybrid search index (Days 21-22) over the new chunks
+            get_hybrid_retriever.clear()
+        except Exception as e:
+            st.error(f"Error chunking in Snowflake: {str(e)}")
+
 # Main content - Review Summary
 if 'loaded_data' in st.session_state:
     with st.container(border=True):
@@ -135,87 +214,64 @@ if 'loaded_data' in st.session_state:
         
         # Add chunk size controls (only show if chunking option is selected)
         if "Chunk reviews" in processing_option:
+            strategy = st.selectbox(
+                "Chunking strategy:",
+                ["words", "sentences", "tokens"],
+                format_func=lambda x: {
+                    "words": "Word windows",
+                    "sentences": "Whole sentences",
+                    "tokens": "Token windows"
+                }[x],
+                help="Word windows split at fixed word counts; sentence chunks never cut a sentence; token windows size chunks for the embedding model"
+            )
+            unit = "tokens" if strategy == "tokens" else "words"
             col1, col2 = st.columns(2)
             with col1:
                 chunk_size = st.slider(
-                    "Chunk Size (words):",
+                    f"Chunk Size ({unit}):",
                     min_value=50,
                     max_value=500,
                     value=200,
                     step=50,
-                    help="Maximum number of words per chunk"
+                    help=f"Maximum number of {unit} per chunk"
                 )
             with col2:
+                # Overlap must stay below the chunk size
+                max_overlap = min(100, chunk_size - 10)
                 overlap = st.slider(
-                    "Overlap (words):",
+                    f"Overlap ({unit}):",
                     min_value=0,
-                    max_value=100,
-                    value=50,
+                    max_value=max_overlap,
+                    value=min(50, max_overlap),
                     step=10,
-                    help="Number of overlapping words between chunks"
+                    help=f"Number of overlapping {unit} between chunks"
                 )
-            st.caption(f"Reviews with >{chunk_size} words will be split into chunks of {chunk_size} words with {overlap} word overlap")
+            st.caption(f"Reviews with >{chunk_size} {unit} will be split into chunks of {chunk_size} {unit} with {overlap} {unit} overlap")
         else:
             # Default values if not chunking
+            strategy = "words"
+            unit = "words"
             chunk_size = 200
             overlap = 50
         
         if st.button(":material/flash_on: Process Reviews", type="primary", use_container_width=True):
-            chunks = []
-            
             with st.status("Processing reviews...", expanded=True) as status:
+                if st.session_state.get('loaded_incremental'):
+                    # Also rechunk reviews last chunked with other settings, so the table never mixes them
+                    params = chunk_params(strategy, None if "Keep each review" in processing_option else chunk_size, overlap)
+                    df = load_reviews(st.session_state.source_table, st.session_state.loaded_chunk_table, params)
+                    st.write(f":material/sync: {len(df)} review(s) are new, changed or chunked with other settings")
+                
                 if "Keep each review" in processing_option:
                     # Option 1: One review = one chunk
                     st.write(":material/edit_note: Creating one chunk per review...")
-                    
-                    for idx, row in df.iterrows():
-                        chunks.append({
-                            'doc_id': row['DOC_ID'],
-                            'file_name': row['FILE_NAME'],
-                            'chunk_id': idx + 1,
-                            'chunk_text': row['EXTRACTED_TEXT'],
-                            'chunk_size': row['WORD_COUNT'],
-                            'chunk_type': 'full_review'
-                        })
-                    
+                    chunks = chunk_documents(df, chunk_size=None)
                     st.write(f":material/check_circle: Created {len(chunks)} chunks (1 per review)")
                     
                 else:
                     # Option 2: Chunk longer reviews
-                    st.write(f":material/edit_note: Chunking reviews longer than {chunk_size} words...")
-                    chunk_id = 1
-                    
-                    for idx, row in df.iterrows():
-                        text = row['EXTRACTED_TEXT']
-                        words = text.split()
-                        
-                        if len(words) <= chunk_size:
-                            # Keep short reviews as-is
-                            chunks.append({
-                                'doc_id': row['DOC_ID'],
-                                'file_name': row['FILE_NAME'],
-                                'chunk_id': chunk_id,
-                                'chunk_text': text,
-                                'chunk_size': len(words),
-                                'chunk_type': 'full_review'
-                            })
-                            chunk_id += 1
-                        else:
-                            # Split longer reviews
-                            for i in range(0, len(words), chunk_size - overlap):
-                                chunk_words = words[i:i + chunk_size]
-                                chunk_text = ' '.join(chunk_words)
-                                
-                                chunks.append({
-                                    'doc_id': row['DOC_ID'],
-                                    'file_name': row['FILE_NAME'],
-                                    'chunk_id': chunk_id,
-                                    'chunk_text': chunk_text,
-                                    'chunk_size': len(chunk_words),
-                                    'chunk_type': 'chunked_review'
-                                })
-                                chunk_id += 1
-                    
+                    st.write(f":material/edit_note: Chunking reviews longer than {chunk_size} {unit}...")
+                    chunks = chunk_documents(df, strategy=strategy, chunk_size=chunk_size, overlap=overlap)
                     st.write(f":material/check_circle: Created {len(chunks)} chunks from {len(df)} reviews")
                 
                 status.update(label="Processing complete!", state="complete", expanded=False)
@@ -237,16 +293,15 @@ if 'loaded_data' in st.session_state:
             with col1:
                 st.metric("Total Chunks", len(chunks))
             with col2:
-                full_reviews = len([c for c in chunks if c['chunk_type'] == 'full_review'])
+                full_reviews = int((chunks['chunk_type'] == 'full_review').sum())
                 st.metric("Full Reviews", full_reviews)
             with col3:
-                split_reviews = len([c for c in chunks if c['chunk_type'] == 'chunked_review'])
+                split_reviews = int((chunks['chunk_type'] == 'chunked_review').sum())
                 st.metric("Split Reviews", split_reviews)
             
             # Display chunks
             with st.expander(":material/description: View Chunks"):
-                chunks_df = pd.DataFrame(chunks)
-                st.dataframe(chunks_df[['chunk_id', 'file_name', 'chunk_size', 'chunk_type', 'chunk_text']], 
+                st.dataframe(chunks[['chunk_id', 'file_name', 'chunk_size', 'chunk_type', 'chunk_text']], 
                             use_container_width=True)
         
         # Step 4: Save chunks to Snowflake
@@ -269,46 +324,44 @@ if 'loaded_data' in st.session_state:
             st.code(full_chunk_table, language="sql")
             
             # Check if chunk table exists and show status
-            chunk_table_exists = False  # Default to False (unticked)
             try:
                 count_result = session.sql(f"""
                     SELECT COUNT(*) as CNT FROM {full_chunk_table}
+                    WHERE NOT COALESCE(IS_DELETED, FALSE)
                 """).collect()
                 
                 if count_result:
                     record_count = count_result[0]['CNT']
                     if record_count > 0:
                         st.warning(f":material/warning: **{record_count} chunk(s)** currently in table `{full_chunk_table}`")
-                        chunk_table_exists = True  # Only tick if table has data
                     else:
                         st.info(":material/inbox: **Chunk table is empty** - No chunks saved yet.")
-                        chunk_table_exists = False
             except:
                 st.info(":material/inbox: **Chunk table doesn't exist yet** - Will be created when you save chunks.")
-                chunk_table_exists = False
             
-            # Initialize or update checkbox state based on table status
-            # This ensures checkbox reflects current table state
+            # Off by default: chunks are merged by ID, so existing ones don't need clearing
             if 'day17_replace_mode' not in st.session_state:
-                # First time - initialize based on table existence
-                st.session_state.day17_replace_mode = chunk_table_exists
-            else:
-                # Check if table name changed - if so, reset based on new table status
-                if 'day17_last_chunk_table' not in st.session_state or st.session_state.day17_last_chunk_table != full_chunk_table:
-                    st.session_state.day17_replace_mode = chunk_table_exists
-                    st.session_state.day17_last_chunk_table = full_chunk_table
+                st.session_state.day17_replace_mode = False
+            
+            # Truncating before saving only the new or changed reviews would drop every other review's chunks
+            partial_load = st.session_state.get('loaded_incremental', False)
+            if partial_load:
+                st.session_state.day17_replace_mode = False
             
             # Replace mode checkbox
             replace_mode = st.checkbox(
                 f":material/sync: Replace Table Mode for `{st.session_state.day17_chunk_table}`",
                 help=f"When enabled, clears all existing data in {full_chunk_table} before saving new chunks",
-                key="day17_replace_mode"
+                key="day17_replace_mode",
+                disabled=partial_load
             )
+            if partial_load:
+                st.caption(":material/info: Replace mode needs all reviews loaded - untick **Only new or changed documents** and reload.")
             
             if replace_mode:
                 st.warning("**Replace Mode Active**: Existing chunks will be deleted before saving new ones.")
             else:
-                st.success("**Append Mode Active**: New chunks will be added to existing data.")
+                st.success("**Append Mode Active**: New chunks are merged by ID; outdated chunks of these reviews are tombstoned.")
             
             # Save chunks to table
             if st.button(":material/save: Save Chunks to Snowflake", type="primary", use_container_width=True):
@@ -316,18 +369,7 @@ if 'loaded_data' in st.session_state:
                     with st.status("Saving chunks to Snowflake...", expanded=True) as status:
                         # Step 1: Create table if it doesn't exist
                         st.write(":material/looks_one: Checking table...")
-                        create_table_sql = f"""
-                        CREATE TABLE IF NOT EXISTS {full_chunk_table} (
-                            CHUNK_ID NUMBER,
-                            DOC_ID NUMBER,
-                            FILE_NAME VARCHAR,
-                            CHUNK_TEXT VARCHAR,
-                            CHUNK_SIZE NUMBER,
-                            CHUNK_TYPE VARCHAR,
-                            CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
-                        )
-                        """
-                        session.sql(create_table_sql).collect()
+                        ensure_chunk_table(session, full_chunk_table)
                         
                         # Step 2: Replace mode - clear existing chunks
                         if replace_mode:
@@ -338,30 +380,10 @@ if 'loaded_data' in st.session_state:
                             except Exception as e:
                                 st.write(f"   :material/warning: No existing chunks to clear")
                         
-                        # Step 3: Insert chunks
-                        st.write(f":material/looks_3: Inserting {len(chunks)} chunk(s)...")
-                        chunks_df = pd.DataFrame(chunks)
-                        
-                        # Rename columns to uppercase to match Snowflake table
-                        chunks_df_upper = chunks_df[['chunk_id', 'doc_id', 'file_name', 'chunk_text', 
-                                                       'chunk_size', 'chunk_type']].copy()
-                        chunks_df_upper.columns = ['CHUNK_ID', 'DOC_ID', 'FILE_NAME', 'CHUNK_TEXT', 
-                                                   'CHUNK_SIZE', 'CHUNK_TYPE']
-                        
-                        if replace_mode:
-                            # Use overwrite for replace mode (though we already truncated)
-                            session.write_pandas(chunks_df_upper,
-                                               table_name=st.session_state.day17_chunk_table,
-                                               database=st.session_state.day17_database,
-                                               schema=st.session_state.day17_schema,
-                                               overwrite=True)
-                        else:
-                            # Append mode
-                            session.write_pandas(chunks_df_upper,
-                                               table_name=st.session_state.day17_chunk_table,
-                                               database=st.session_state.day17_database,
-                                               schema=st.session_state.day17_schema,
-                                               overwrite=False)
+                        # Step 3: Merge chunks by their stable IDs
+                        st.write(f":material/looks_3: Merging {len(chunks)} chunk(s)...")
+                        inserted, restored, tombstoned = save_chunks(session, chunks, full_chunk_table, st.session_state.source_table)
+                        st.write(f"   :material/check_circle: {inserted} inserted, {restored} restored, {tombstoned} tombstoned")
                         
                         status.update(label=":material/check_circle: Chunks saved!", state="complete", expanded=False)
                     
@@ -373,6 +395,8 @@ if 'loaded_data' in st.session_state:
                     st.session_state.chunks_database = st.session_state.day17_database
                     st.session_state.chunks_schema = st.session_state.day17_schema
                     st.session_state.chunk_table_saved = True
+                    # Rebuild the hybrid search index (Days 21-22) over the new chunks
+                    get_hybrid_retriever.clear()
                     
                     st.balloons()
                     
@@ -400,7 +424,8 @@ with st.container(border=True):
                 LEFT(CHUNK_TEXT, 100) AS TEXT_PREVIEW,
                 CREATED_TIMESTAMP
             FROM {full_chunk_table}
-            ORDER BY CHUNK_ID
+            WHERE NOT COALESCE(IS_DELETED, FALSE)
+            ORDER BY FILE_NAME, CHUNK_ID
             """
             chunks_df = session.sql(query_sql).to_pandas()
             
@@ -1,20 +1,23 @@
 import streamlit as st
-from snowflake.cortex import embed_text_768
 import pandas as pd
 import numpy as np
+import json
+import os
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.embeddings import embed_in_snowflake, embed_texts, ensure_embedding_table, save_embeddings
+from shared.hybrid import get_hybrid_retriever
+from shared.session import get_session
+from shared.vector_store import EmbeddingStore, default_store_path, discard_store
 
 st.title(":material/calculate: Embeddings Generator for Customer Reviews")
 st.write("Generate embeddings for review chunks from Day 17 to enable semantic search.")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Initialize session state for database configuration
 if 'day18_database' not in st.session_state:
@@ -81,12 +84,19 @@ with st.container(border=True):
     if 'chunks_data' in st.session_state:
         st.success(f":material/check_circle: **{len(st.session_state.chunks_data)} chunk(s)** already loaded")
     
+    missing_only = st.checkbox(
+        ":material/difference: Only chunks without embeddings",
+        value=True,
+        help="Skip chunks that already have an embedding, so only new or changed documents are embedded"
+    )
+    
     # Load chunks button
     if st.button(":material/folder_open: Load Chunks", type="primary", use_container_width=True):
         try:
             with st.status("Loading chunks...", expanded=True) as status:
                 st.write(":material/wifi: Querying database...")
                 
+                embedding_table = f"{st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_embedding_table}"
                 query = f"""
                 SELECT 
                     CHUNK_ID,
@@ -95,22 +105,78 @@ with st.container(border=True):
                     CHUNK_TEXT,
                     CHUNK_SIZE,
                     CHUNK_TYPE
-                FROM {st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_chunk_table}
-                ORDER BY CHUNK_ID
+                FROM {st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_chunk_table} c
+                WHERE NOT COALESCE(c.IS_DELETED, FALSE)
+                """
+                
+                # Only chunks that don't have an embedding yet
+                incremental = False
+                if missing_only:
+                    try:
+                        session.sql(f"SELECT CHUNK_ID FROM {embedding_table} LIMIT 0").collect()
+                        incremental = True
+                    except:
+                        st.write(":material/info: No embedding table yet - loading all chunks")
+                if incremental:
+                    query += f"""
+                AND NOT EXISTS (SELECT 1 FROM {embedding_table} e WHERE e.CHUNK_ID = c.CHUNK_ID)
                 """
+                query += "ORDER BY CHUNK_ID"
                 df = session.sql(query).to_pandas()
                 
-                st.write(f":material/check_circle: Loaded {len(df)} chunks")
+                st.write(f":material/check_circle: Loaded {len(df)} {'new ' if incremental else ''}chunks")
                 status.update(label="Chunks loaded successfully!", state="complete", expanded=False)
                 
                 # Store in session state
                 st.session_state.chunks_data = df
+                st.session_state.chunks_incremental = incremental
                 st.rerun()
                 
         except Exception as e:
             st.error(f"Error loading chunks: {str(e)}")
             st.info(":material/lightbulb: Make sure you've processed reviews in Day 17 first!")
 
+# Server-side embedding: chunk text never leaves Snowflake
+with st.container(border=True):
+    st.subheader(":material/cloud_sync: Embed Inside Snowflake")
+    st.write("Skip loading chunks into the app: a single `INSERT ... SELECT` embeds every chunk that doesn't have an embedding yet.")
+    
+    server_chunk_table = f"{st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_chunk_table}"
+    server_embedding_table = f"{st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_embedding_table}"
+    
+    server_reembed = st.checkbox(
+        "Re-embed chunks that already have embeddings",
+        value=False,
+        key="day18_server_reembed",
+        help="Recompute every live chunk's embedding, e.g. after changing the embedding model"
+    )
+    st.caption(f":material/arrow_forward: `{server_chunk_table}` → `{server_embedding_table}`")
+    
+    if st.button(":material/cloud_sync: Embed in Snowflake", use_container_width=True):
+        try:
+            with st.status("Embedding in Snowflake...", expanded=True) as status:
+                st.write(":material/looks_one: Preparing embedding table...")
+                ensure_embedding_table(session, server_embedding_table)
+                
+                st.write(":material/looks_two: Embedding chunks with EMBED_TEXT_768...")
+                written = embed_in_snowflake(session, server_chunk_table, server_embedding_table,
+                                             missing_only=not server_reembed)
+                status.update(label=":material/check_circle: Embedding complete!", state="complete", expanded=False)
+            
+            st.success(f":material/check_circle: Wrote {written} embeddings to `{server_embedding_table}`")
+            
+            # Store for Day 19; there is nothing left to save
+            st.session_state.embeddings_table = server_embedding_table
+            st.session_state.embeddings_database = st.session_state.day18_database
+            st.session_state.embeddings_schema = st.session_state.day18_schema
+            st.session_state.pop('embeddings_data', None)
+            # Rebuild the hybrid search index (Days 21-22) over the new embeddings
+            get_hybrid_retriever.clear()
+            # The local vector cache no longer matches the table
+            discard_store(default_store_path(server_embedding_table))
+        except Exception as e:
+            st.error(f"Error embedding in Snowflake: {str(e)}")
+
 # Main content - Chunk Summary
 if 'chunks_data' in st.session_state:
     with st.container(border=True):
@@ -155,33 +221,30 @@ if 'chunks_data' in st.session_state:
         - Group similar feedback together semantically
         """)
         
+        st.caption(":material/lightbulb: To embed without loading chunks into the app, use **Embed Inside Snowflake** above.")
+        
         # Batch size selection
-        batch_size = st.selectbox("Batch Size", [10, 25, 50, 100], index=1,
-                                  help="Number of chunks to process at once")
+        col1, col2 = st.columns(2)
+        with col1:
+            batch_size = st.selectbox("Batch Size", [10, 25, 50, 100], index=2,
+                                      help="Number of chunks embedded by each query")
+        with col2:
+            max_workers = st.selectbox("Concurrent Batches", [1, 2, 4, 8], index=2,
+                                       help="Number of batch queries running at once")
 
         if st.button(":material/calculate: Generate Embeddings", type="primary", use_container_width=True):
             try:
                 with st.status("Generating embeddings...", expanded=True) as status:
-                    embeddings = []
-                    total_chunks = len(df)
                     progress_bar = st.progress(0)
+                    progress_text = st.empty()
                     
-                    for i in range(0, total_chunks, batch_size):
-                        batch_end = min(i + batch_size, total_chunks)
-                        st.write(f"Processing chunks {i+1} to {batch_end} of {total_chunks}...")
-                        
-                        for idx, row in df.iloc[i:batch_end].iterrows():
-                            # Generate embedding using the correct function signature
-                            emb = embed_text_768(model='snowflake-arctic-embed-m', text=row['CHUNK_TEXT'])
-                            embeddings.append({
-                                'chunk_id': row['CHUNK_ID'],
-                                'embedding': emb
-                            })
-                        
-                        # Update progress
-                        progress = batch_end / total_chunks
-                        progress_bar.progress(progress)
+                    def show_progress(done, total):
+                        progress_bar.progress(done / total)
+                        progress_text.write(f"Embedded {done:,} of {total:,} chunks...")
                     
+                    vectors = embed_texts(session, df['CHUNK_TEXT'].tolist(), batch_size=batch_size,
+                                          max_workers=max_workers, on_batch=show_progress)
+                    embeddings = EmbeddingStore(df['CHUNK_ID'].to_numpy(), vectors)
                     status.update(label="Embeddings generated!", state="complete", expanded=False)
                     
                     # Store in session state
@@ -199,17 +262,19 @@ if 'chunks_data' in st.session_state:
             
             embeddings = st.session_state.embeddings_data
             
-            col1, col2 = st.columns(2)
+            col1, col2, col3 = st.columns(3)
             with col1:
                 st.metric("Embeddings Generated", len(embeddings))
             with col2:
-                st.metric("Dimensions per Embedding", 768)
+                st.metric("Dimensions per Embedding", embeddings.dim)
+            with col3:
+                st.metric("Memory (float32)", f"{embeddings.vectors.nbytes / 1024 / 1024:.1f} MB")
             
             # Show sample embedding
             with st.expander(":material/search: View Sample Embedding"):
-                sample_emb = embeddings[0]['embedding']
+                sample_emb = embeddings.vectors[0]
                 st.write("**First 10 values:**")
-                st.write(sample_emb[:10])
+                st.write(sample_emb[:10].tolist())
         
         # Save embeddings to Snowflake
         with st.container(border=True):
@@ -241,28 +306,29 @@ if 'chunks_data' in st.session_state:
                 
                 if current_count > 0:
                     st.warning(f":material/warning: **{current_count:,} embedding(s)** currently in table `{full_embedding_table}`")
-                    embedding_table_exists = True
                 else:
                     st.info(":material/inbox: **Embedding table is empty** - No embeddings saved yet.")
-                    embedding_table_exists = False
             except:
                 st.info(":material/inbox: **Embedding table doesn't exist yet** - Will be created when you save embeddings.")
-                embedding_table_exists = False
             
-            # Initialize or update checkbox state based on table status
+            # Off by default: embeddings are replaced by CHUNK_ID, so existing ones don't need clearing
             if 'day18_replace_mode' not in st.session_state:
-                st.session_state.day18_replace_mode = embedding_table_exists
-            else:
-                if 'day18_last_embedding_table' not in st.session_state or st.session_state.day18_last_embedding_table != full_embedding_table:
-                    st.session_state.day18_replace_mode = embedding_table_exists
-                    st.session_state.day18_last_embedding_table = full_embedding_table
+                st.session_state.day18_replace_mode = False
+            
+            # Recreating the table before saving only the missing embeddings would drop all the others
+            partial_load = st.session_state.get('chunks_incremental', False)
+            if partial_load:
+                st.session_state.day18_replace_mode = False
             
             # Replace mode checkbox
             replace_mode = st.checkbox(
                 f":material/sync: Replace Table Mode for `{st.session_state.day18_embedding_table}`",
                 help=f"When enabled, replaces all existing embeddings in {full_embedding_table}",
-                key="day18_replace_mode"
+                key="day18_replace_mode",
+                disabled=partial_load
             )
+            if partial_load:
+                st.caption(":material/info: Replace mode needs all chunks loaded - untick **Only chunks without embeddings** and reload.")
             
             if replace_mode:
                 st.warning("**Replace Mode Active**: Existing embeddings will be deleted before saving new ones.")
@@ -275,50 +341,28 @@ if 'chunks_data' in st.session_state:
                         # Step 1: Create or truncate embeddings table
                         st.write(":material/looks_one: Preparing table...")
                         
-                        if replace_mode:
-                            # Replace existing data
-                            create_table_sql = f"""
-                            CREATE OR REPLACE TABLE {full_embedding_table} (
-                                CHUNK_ID NUMBER,
-                                EMBEDDING VECTOR(FLOAT, 768),
-                                CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
-                            )
-                            """
-                            session.sql(create_table_sql).collect()
-                            st.write(":material/check_circle: Replaced existing table")
-                        else:
-                            # Create if doesn't exist
-                            create_table_sql = f"""
-                            CREATE TABLE IF NOT EXISTS {full_embedding_table} (
-                                CHUNK_ID NUMBER,
-                                EMBEDDING VECTOR(FLOAT, 768),
-                                CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
-                            )
-                            """
-                            session.sql(create_table_sql).collect()
-                            st.write(":material/check_circle: Table ready")
+                        ensure_embedding_table(session, full_embedding_table, replace=replace_mode)
+                        st.write(":material/check_circle: Replaced existing table" if replace_mode else ":material/check_circle: Table ready")
                         
-                        # Step 2: Insert embeddings
-                        st.write(f":material/looks_two: Inserting {len(embeddings)} embeddings...")
+                        # Step 2: Bulk load embeddings
+                        st.write(f":material/looks_two: Uploading {len(embeddings)} embeddings...")
+                        saved = save_embeddings(
+                            session,
+                            embeddings.ids,
+                            embeddings.vectors,
+                            full_embedding_table,
+                            on_batch=lambda written: st.write(f"Staged {written} of {len(embeddings)} embeddings...")
+                        )
+                        st.write(f":material/check_circle: Inserted {saved} embeddings")
                         
-                        for i, emb_data in enumerate(embeddings):
-                            # Get embedding list
-                            if isinstance(emb_data['embedding'], list):
-                                emb_list = emb_data['embedding']
-                            else:
-                                emb_list = list(emb_data['embedding'])
-                            
-                            # Convert to proper array format for Snowflake
-                            emb_array = "[" + ",".join([str(float(x)) for x in emb_list]) + "]"
-                            
-                            insert_sql = f"""
-                            INSERT INTO {full_embedding_table} (CHUNK_ID, EMBEDDING)
-                            SELECT {emb_data['chunk_id']}, {emb_array}::VECTOR(FLOAT, 768)
-                            """
-                            session.sql(insert_sql).collect()
-                            
-                            if (i + 1) % 10 == 0:
-                                st.write(f"Saved {i + 1} of {len(embeddings)} embeddings...")
+                        if not replace_mode:
+                            # Remove embeddings of chunks that no longer exist; tombstoned chunks keep
+                            # theirs, since they are restored under the same CHUNK_ID if their content comes back
+                            full_chunk_table = f"{st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_chunk_table}"
+                            session.sql(f"""
+                            DELETE FROM {full_embedding_table}
+                            WHERE CHUNK_ID NOT IN (SELECT CHUNK_ID FROM {full_chunk_table})
+                            """).collect()
                         
                         status.update(label="Embeddings saved!", state="complete", expanded=False)
                     
@@ -329,6 +373,10 @@ if 'chunks_data' in st.session_state:
                     st.session_state.embeddings_table = full_embedding_table
                     st.session_state.embeddings_database = st.session_state.day18_database
                     st.session_state.embeddings_schema = st.session_state.day18_schema
+                    # Rebuild the hybrid search index (Days 21-22) over the new embeddings
+                    get_hybrid_retriever.clear()
+                    # The local vector cache no longer matches the table
+                    discard_store(default_store_path(full_embedding_table))
                     
                     st.balloons()
                     
@@ -342,6 +390,7 @@ with st.container(border=True):
     # Check if embeddings table exists and show record count
     full_embedding_table = f"{st.session_state.day18_database}.{st.session_state.day18_schema}.{st.session_state.day18_embedding_table}"
     
+    record_count = None
     try:
         count_result = session.sql(f"""
             SELECT COUNT(*) as CNT FROM {full_embedding_table}
@@ -356,14 +405,21 @@ with st.container(border=True):
     except:
         st.info(":material/inbox: **Embedding table doesn't exist yet** - Generate and save embeddings to create it.")
     
-    query_button = st.button(":material/analytics: Query Embedding Table", type="secondary", use_container_width=True)
+    col1, col2 = st.columns(2)
+    with col1:
+        query_button = st.button(":material/analytics: Query Embedding Table", type="secondary", use_container_width=True)
+    with col2:
+        cache_button = st.button(":material/download: Cache Embeddings Locally", type="secondary", use_container_width=True,
+                                 help="Download all vectors once into a memory-mapped float32 file for local search")
+    
+    store_path = default_store_path(full_embedding_table)
     
     if query_button:
         try:
+            # Vectors stay in Snowflake; single ones are fetched on demand below
             query = f"""
             SELECT 
                 CHUNK_ID,
-                EMBEDDING,
                 CREATED_TIMESTAMP,
                 VECTOR_L2_DISTANCE(EMBEDDING, EMBEDDING) as SELF_DISTANCE
             FROM {full_embedding_table}
@@ -374,11 +430,21 @@ with st.container(border=True):
             # Store in session state
             st.session_state.queried_embeddings = result_df
             st.session_state.queried_embeddings_table = full_embedding_table
+            st.session_state.pop('loaded_embedding', None)
             st.rerun()
             
         except Exception as e:
             st.error(f"Error querying embeddings: {str(e)}")
     
+    if cache_button:
+        try:
+            with st.spinner("Downloading embeddings..."):
+                store = EmbeddingStore.from_table(session, full_embedding_table)
+                store.save(store_path)
+            st.success(f":material/check_circle: Cached {len(store):,} embeddings ({store.vectors.nbytes / 1024 / 1024:.1f} MB) in `{store_path}`")
+        except Exception as e:
+            st.error(f"Error caching embeddings: {str(e)}")
+    
     # Display results if available in session state
     if 'queried_embeddings' in st.session_state and st.session_state.get('queried_embeddings_table') == full_embedding_table:
         emb_df = st.session_state.queried_embeddings
@@ -393,66 +459,56 @@ with st.container(border=True):
             with col2:
                 st.metric("Dimensions", "768")
             
-            # Display table without the EMBEDDING column for readability
-            # Check which columns exist (case-insensitive)
-            embedding_col = None
-            for col in emb_df.columns:
-                if col.upper() == 'EMBEDDING':
-                    embedding_col = col
-                    break
-            
-            if embedding_col:
-                display_df = emb_df.drop(columns=[embedding_col])
-            else:
-                display_df = emb_df
-            
-            st.dataframe(display_df, use_container_width=True)
+            st.dataframe(emb_df, use_container_width=True)
             
             st.info(":material/lightbulb: Self-distance should be 0, confirming embeddings are stored correctly")
             
-            # View individual embedding vectors (only if EMBEDDING column exists)
-            if embedding_col:
-                with st.expander(":material/search: View Individual Embedding Vectors"):
-                    st.write("Select a CHUNK_ID to view its full 768-dimensional embedding vector:")
+            # View individual embedding vectors
+            with st.expander(":material/search: View Individual Embedding Vectors"):
+                st.write("Select a CHUNK_ID to view its full 768-dimensional embedding vector:")
+                
+                chunk_ids = emb_df['CHUNK_ID'].tolist()
+                selected_chunk = st.selectbox("Select CHUNK_ID", chunk_ids, key="view_embedding_chunk")
+                
+                if st.button(":material/analytics: Load Embedding Vector", key="load_embedding_btn"):
+                    # Read from the local cache when it has this chunk, otherwise fetch just this vector
+                    selected_emb = None
+                    if os.path.exists(store_path):
+                        store = EmbeddingStore.load(store_path)
+                        if len(store) != record_count:
+                            # Written by another app or process since it was cached
+                            discard_store(store_path)
+                        else:
+                            try:
+                                selected_emb = store.vector(selected_chunk).tolist()
+                            except KeyError:
+                                pass
+                    if selected_emb is None:
+                        row = session.sql(
+                            f"SELECT EMBEDDING::ARRAY AS EMBEDDING FROM {full_embedding_table} WHERE CHUNK_ID = ?",
+                            params=[int(selected_chunk)]
+                        ).collect()[0]
+                        selected_emb = row['EMBEDDING']
                     
-                    # Find CHUNK_ID column (case-insensitive)
-                    chunk_id_col = None
-                    for col in emb_df.columns:
-                        if col.upper() == 'CHUNK_ID':
-                            chunk_id_col = col
-                            break
+                    # Store in session state
+                    st.session_state.loaded_embedding = selected_emb
+                    st.session_state.loaded_embedding_chunk = selected_chunk
+                    st.rerun()
+                
+                # Display loaded embedding
+                if 'loaded_embedding' in st.session_state:
+                    st.write(f"**Embedding Vector for CHUNK_ID {st.session_state.loaded_embedding_chunk}:**")
                     
-                    chunk_ids = emb_df[chunk_id_col].tolist()
-                    selected_chunk = st.selectbox("Select CHUNK_ID", chunk_ids, key="view_embedding_chunk")
+                    # Convert to list if needed
+                    emb_vector = st.session_state.loaded_embedding
+                    if isinstance(emb_vector, str):
+                        # If it's a string representation, parse it
+                        emb_vector = json.loads(emb_vector)
                     
-                    if st.button(":material/analytics: Load Embedding Vector", key="load_embedding_btn"):
-                        # Get the embedding for selected chunk
-                        selected_emb = emb_df[emb_df[chunk_id_col] == selected_chunk][embedding_col].iloc[0]
-                        
-                        # Store in session state
-                        st.session_state.loaded_embedding = selected_emb
-                        st.session_state.loaded_embedding_chunk = selected_chunk
-                        st.rerun()
+                    st.caption(f"Vector length: {len(emb_vector)} dimensions")
                     
-                    # Display loaded embedding
-                    if 'loaded_embedding' in st.session_state:
-                        st.write(f"**Embedding Vector for CHUNK_ID {st.session_state.loaded_embedding_chunk}:**")
-                        
-                        # Convert to list if needed
-                        emb_vector = st.session_state.loaded_embedding
-                        if isinstance(emb_vector, str):
-                            # If it's a string representation, parse it
-                            import json
-                            emb_vector = json.loads(emb_vector)
-                        elif hasattr(emb_vector, 'tolist'):
-                            emb_vector = emb_vector.tolist()
-                        elif not isinstance(emb_vector, list):
-                            emb_vector = list(emb_vector)
-                        
-                        st.caption(f"Vector length: {len(emb_vector)} dimensions")
-                        
-                        # Display the full embedding vector as code
-                        st.code(emb_vector, language="python")
+                    # Display the full embedding vector as code
+                    st.code(emb_vector, language="python")
         else:
             st.info(":material/inbox: No embeddings found in table.")
     else:
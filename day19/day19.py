@@ -1,19 +1,20 @@
 import streamlit as st
 from snowflake.core import Root
 import pandas as pd
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.retrieval_cache import get_retrieval_cache
+from shared.service_catalog import get_service_catalog
+from shared.session import get_session
 
 st.title(":material/search: Cortex Search for Customer Reviews")
 st.write("Create a semantic search service for the customer reviews processed in Days 16-18.")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Initialize session state for database configuration
 if 'day19_database' not in st.session_state:
@@ -65,7 +66,8 @@ SELECT
     rc.DOC_ID,
     rc.CHUNK_TYPE
 FROM {st.session_state.day19_database}.{st.session_state.day19_schema}.REVIEW_CHUNKS rc
-WHERE rc.CHUNK_TEXT IS NOT NULL;
+WHERE rc.CHUNK_TEXT IS NOT NULL
+  AND NOT COALESCE(rc.IS_DELETED, FALSE);  -- Skip tombstoned chunks
 """, language="sql")
     
     # Button to create view
@@ -81,6 +83,7 @@ WHERE rc.CHUNK_TEXT IS NOT NULL;
                 rc.CHUNK_TYPE
             FROM {st.session_state.day19_database}.{st.session_state.day19_schema}.REVIEW_CHUNKS rc
             WHERE rc.CHUNK_TEXT IS NOT NULL
+              AND NOT COALESCE(rc.IS_DELETED, FALSE)
             """
             session.sql(create_view_sql).collect()
             st.success(f":material/check_circle: Created view: `{st.session_state.day19_database}.{st.session_state.day19_schema}.REVIEW_SEARCH_VIEW`")
@@ -140,6 +143,9 @@ AS (
                 )
                 """
                 session.sql(create_service_sql).collect()
+                # Show the new service in Days 20-22 and drop results cached from a previous version of it
+                get_service_catalog().invalidate()
+                get_retrieval_cache().clear()
 
                 st.write(":material/looks_two: Waiting for indexing to complete...")
                 st.caption("This may take a few minutes for 100 reviews...")
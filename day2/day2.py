@@ -1,18 +1,17 @@
 import streamlit as st
 from snowflake.snowpark.functions import ai_complete
 import json
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session
 
 st.title(":material/smart_toy: Hello, Cortex!")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create() 
+session = get_session()
 
 # Model and prompt
 model = "claude-3-5-sonnet"
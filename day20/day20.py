@@ -1,18 +1,20 @@
 import streamlit as st
-from snowflake.core import Root
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.search import search
+from shared.service_catalog import get_service_catalog
+from shared.session import get_session
+from shared.similarity import METRICS, exact_search, recall_at_k, sql_search
+from shared.vector_index import build_local_service, load_local_service, local_index_path
 
 st.title(":material/search: Querying Cortex Search")
 st.write("Search and retrieve relevant text chunks using Cortex Search Service.")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Input Container
 with st.container(border=True):
@@ -21,13 +23,8 @@ with st.container(border=True):
     # Default search service from Day 19
     default_service = 'RAG_DB.RAG_SCHEMA.CUSTOMER_REVIEW_SEARCH'
     
-    # Try to get available services
-    try:
-        services_result = session.sql("SHOW CORTEX SEARCH SERVICES").collect()
-        available_services = [f"{row['database_name']}.{row['schema_name']}.{row['name']}" 
-                            for row in services_result] if services_result else []
-    except:
-        available_services = []
+    # Available services, discovered once and cached across reruns
+    available_services = get_service_catalog().services(session)
     
     # Ensure default service is always first
     if default_service in available_services:
@@ -80,6 +77,64 @@ with st.container(border=True):
 
     num_results = st.slider("Number of results:", 1, 20, 5)
     
+    retrieval = st.radio(
+        "Retrieval:",
+        ["Cortex Search", "Exact (in Snowflake)", "Local index"],
+        horizontal=True,
+        help="Exact search scores every stored embedding with Snowflake's vector similarity functions; the local index is an offline fallback"
+    )
+    if retrieval == "Exact (in Snowflake)":
+        metric = st.selectbox("Similarity metric:", METRICS, format_func=lambda m: {
+            "cosine": "Cosine similarity", "dot": "Inner product", "l2": "L2 distance"
+        }[m])
+    
+    # Embedding tables for exact search and the local vector index
+    with st.expander(":material/offline_bolt: Embeddings & Local Index"):
+        st.caption("The local index is an IVF index over REVIEW_EMBEDDINGS, used when the service is unreachable or still indexing. Probing more lists raises recall at the cost of latency.")
+        service_parts = search_service.split(".") if search_service else []
+        service_db, service_schema = service_parts[:2] if len(service_parts) == 3 else ("RAG_DB", "RAG_SCHEMA")
+        embedding_table = st.text_input(
+            "Embeddings table:",
+            value=st.session_state.get('embeddings_table', f"{service_db}.{service_schema}.REVIEW_EMBEDDINGS")
+        )
+        chunk_table = st.text_input(
+            "Chunks table:",
+            value=st.session_state.get('chunks_table', f"{service_db}.{service_schema}.REVIEW_CHUNKS")
+        )
+        
+        local_service = None
+        if search_service and len(search_service.split(".")) == 3:
+            col1, col2 = st.columns(2)
+            with col1:
+                nlist = st.number_input("Lists (0 = automatic):", min_value=0, max_value=65536, value=0,
+                                        help="Number of k-means clusters; about 4 x sqrt(vectors) by default")
+            with col2:
+                nprobe = st.number_input("Lists probed per query:", min_value=1, max_value=1024, value=8)
+            
+            local_service = load_local_service(session, search_service)
+            if local_service is not None:
+                st.success(f":material/check_circle: Local index: {len(local_service.index):,} vectors in {local_service.index.nlist} lists")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button(":material/build: Build Local Index", use_container_width=True):
+                    try:
+                        with st.spinner("Downloading embeddings and training the index..."):
+                            local_service = build_local_service(session, embedding_table, chunk_table,
+                                                                nlist=nlist or None, nprobe=nprobe)
+                            local_service.save(local_index_path(search_service))
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Error building local index: {str(e)}")
+            with col2:
+                if st.button(":material/rule: Measure Recall@10", use_container_width=True, disabled=local_service is None):
+                    # Stored vectors as queries, exact search as ground truth
+                    index = local_service.index
+                    sample = index.store[::max(1, len(index.store) // 200)]
+                    approximate, _ = index.search(sample.vectors, k=10, nprobe=nprobe)
+                    exact, _ = exact_search(index.store, sample.vectors, k=10)
+                    st.metric(f"Recall@10 at {nprobe} probed lists", f"{recall_at_k(approximate, exact):.1%}")
+    
     search_clicked = st.button(":material/search: Search", type="primary", use_container_width=True)
 
 # Output Container
@@ -89,28 +144,33 @@ with st.container(border=True):
     if search_clicked:
         if query and search_service:
             try:
-                root = Root(session)
-                parts = search_service.split(".")
-                
-                if len(parts) != 3:
+                if len(search_service.split(".")) != 3:
                     st.error("Service path must be in format: database.schema.service_name")
                 else:
-                    svc = (root
-                        .databases[parts[0]]
-                        .schemas[parts[1]]
-                        .cortex_search_services[parts[2]])
-                    
+                    columns = ["CHUNK_TEXT", "FILE_NAME", "CHUNK_TYPE", "CHUNK_ID"]
                     with st.spinner("Searching..."):
-                        results = svc.search(
-                            query=query,
-                            columns=["CHUNK_TEXT", "FILE_NAME", "CHUNK_TYPE", "CHUNK_ID"],
-                            limit=num_results
-                        )
+                        if retrieval == "Exact (in Snowflake)":
+                            results = sql_search(session, embedding_table, chunk_table, query,
+                                                 columns, limit=num_results, metric=metric)
+                            source = "exact"
+                        else:
+                            results, source = search(
+                                session,
+                                search_service,
+                                query,
+                                columns=columns,
+                                limit=num_results,
+                                prefer_local=retrieval == "Local index"
+                            )
                     
-                    st.success(f":material/check_circle: Found {len(results.results)} result(s)!")
+                    st.success(f":material/check_circle: Found {len(results)} result(s)!")
+                    if source == "local":
+                        st.caption(":material/offline_bolt: Results from the local index")
+                    elif source == "exact":
+                        st.caption(f":material/calculate: Exact {metric} search over `{embedding_table}`")
                     
                     # Display results
-                    for i, item in enumerate(results.results, 1):
+                    for i, item in enumerate(results, 1):
                         with st.container(border=True):
                             col1, col2, col3 = st.columns([2, 1, 1])
                             with col1:
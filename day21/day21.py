@@ -1,17 +1,20 @@
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import cortex_complete
+from shared.retrieval_cache import get_retrieval_cache
+from shared.search import hybrid_search, search
+from shared.service_catalog import get_service_catalog
+from shared.session import get_session
 
 st.title(":material/link: RAG with Cortex Search")
 st.write("Combine search results with LLM generation for grounded answers.")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 st.divider()
 st.subheader(":material/menu_book: How RAG Works")
@@ -57,13 +60,8 @@ with st.sidebar:
     # Default search service from Day 19
     default_service = 'RAG_DB.RAG_SCHEMA.CUSTOMER_REVIEW_SEARCH'
     
-    # Try to get available services
-    try:
-        services_result = session.sql("SHOW CORTEX SEARCH SERVICES").collect()
-        available_services = [f"{row['database_name']}.{row['schema_name']}.{row['name']}" 
-                            for row in services_result] if services_result else []
-    except:
-        available_services = []
+    # Available services, discovered once and cached across reruns
+    available_services = get_service_catalog().services(session)
     
     # Ensure default service is always first
     if default_service in available_services:
@@ -105,6 +103,15 @@ with st.sidebar:
     num_chunks = st.slider("Context chunks:", 1, 10, 3,
                            help="Number of relevant chunks to retrieve")
     
+    retrieval = st.radio(
+        "Retrieval:",
+        ["Cortex Search", "Hybrid (keywords + vectors)"],
+        help="Hybrid fuses BM25 keyword matches, which catch exact product names and order IDs, with vector search"
+    )
+    if retrieval.startswith("Hybrid"):
+        keyword_weight = st.slider("Keyword weight:", 0.0, 2.0, 1.0, 0.1)
+        vector_weight = st.slider("Vector weight:", 0.0, 2.0, 1.0, 0.1)
+    
     model = st.selectbox(
         "LLM Model:",
         ["claude-3-5-sonnet", "mistral-large", "llama3.1-8b"],
@@ -130,36 +137,35 @@ if st.button(":material/search: Search & Answer", type="primary"):
             st.write(":material/search: **Step 1:** Searching documents...")
             
             try:
-                from snowflake.core import Root
-                
-                root = Root(session)
-                parts = search_service.split(".")
-                
-                if len(parts) != 3:
+                if len(search_service.split(".")) != 3:
                     st.error("Service path must be in format: database.schema.service_name")
                     st.stop()
                 
-                svc = (root
-                    .databases[parts[0]]
-                    .schemas[parts[1]]
-                    .cortex_search_services[parts[2]])
-                
-                search_results = svc.search(
-                    query=question,
-                    columns=["CHUNK_TEXT", "FILE_NAME"],
-                    limit=num_chunks
-                )
+                if retrieval.startswith("Hybrid"):
+                    search_results = hybrid_search(search_service, question, ["CHUNK_TEXT", "FILE_NAME"], num_chunks,
+                                                   keyword_weight=keyword_weight, vector_weight=vector_weight)
+                    search_source = "hybrid"
+                else:
+                    # Falls back to the local index from Day 20 if the service can't be reached
+                    search_results, search_source = search(
+                        session,
+                        search_service,
+                        question,
+                        columns=["CHUNK_TEXT", "FILE_NAME"],
+                        limit=num_chunks,
+                        cache=get_retrieval_cache()
+                    )
                 
                 # Extract context with metadata
                 context_chunks = []
                 sources = []
-                for item in search_results.results:
+                for item in search_results:
                     context_chunks.append(item.get("CHUNK_TEXT", ""))
                     sources.append(item.get("FILE_NAME", "Unknown"))
                 
                 context = "\n\n---\n\n".join(context_chunks)
                 
-                st.write(f"   :material/check_circle: Found {len(context_chunks)} relevant chunks")
+                st.write(f"   :material/check_circle: Found {len(context_chunks)} relevant chunks" + ({"local": " (local index)", "hybrid": " (hybrid)"}.get(search_source, "")))
                 
                 # Step 2: Generate answer with LLM
                 st.write(":material/smart_toy: **Step 2:** Generating answer...")
@@ -175,14 +181,7 @@ USER QUESTION: {question}
 Provide a clear, accurate answer based on the context. If you use information from the context, mention it naturally."""
                 
                 # Call LLM
-                response_sql = f"""
-                SELECT SNOWFLAKE.CORTEX.COMPLETE(
-                    '{model}',
-                    '{rag_prompt.replace("'", "''")}'
-                ) as response
-                """
-                
-                response = session.sql(response_sql).collect()[0][0]
+                response = cortex_complete(session, rag_prompt, model)
                 
                 st.write("   :material/check_circle: Answer generated")
                 status.update(label="Complete!", state="complete", expanded=True)
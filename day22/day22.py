@@ -1,17 +1,20 @@
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import cortex_complete
+from shared.retrieval_cache import get_retrieval_cache
+from shared.search import hybrid_search, search
+from shared.service_catalog import get_service_catalog
+from shared.session import get_session
 
 st.title(":material/chat: Chat with Your Documents")
 st.write("A conversational RAG chatbot powered by Cortex Search.")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Initialize state
 if "doc_messages" not in st.session_state:
@@ -24,13 +27,8 @@ with st.sidebar:
     # Check for search service from Day 19
     default_service = st.session_state.get('search_service', 'RAG_DB.RAG_SCHEMA.CUSTOMER_REVIEW_SEARCH')
     
-    # Try to get available services
-    try:
-        services_result = session.sql("SHOW CORTEX SEARCH SERVICES").collect()
-        available_services = [f"{row['database_name']}.{row['schema_name']}.{row['name']}" 
-                            for row in services_result] if services_result else []
-    except:
-        available_services = []
+    # Available services, discovered once and cached across reruns
+    available_services = get_service_catalog().services(session)
     
     # Ensure default service is always first in the list
     if default_service:
@@ -74,6 +72,15 @@ with st.sidebar:
     num_chunks = st.slider("Context chunks:", 1, 5, 3,
                            help="Number of relevant chunks to retrieve per question")
     
+    retrieval = st.radio(
+        "Retrieval:",
+        ["Cortex Search", "Hybrid (keywords + vectors)"],
+        help="Hybrid fuses BM25 keyword matches, which catch exact product names and order IDs, with vector search"
+    )
+    if retrieval.startswith("Hybrid"):
+        keyword_weight = st.slider("Keyword weight:", 0.0, 2.0, 1.0, 0.1)
+        vector_weight = st.slider("Vector weight:", 0.0, 2.0, 1.0, 0.1)
+    
     st.divider()
     
     if st.button(":material/delete: Clear Chat", use_container_width=True):
@@ -82,16 +89,16 @@ with st.sidebar:
 
 # Search function
 def search_documents(query, service_path, limit):
-    from snowflake.core import Root
-    root = Root(session)
-    parts = service_path.split(".")
-    if len(parts) != 3:
-        raise ValueError("Service path must be in format: database.schema.service_name")
-    svc = root.databases[parts[0]].schemas[parts[1]].cortex_search_services[parts[2]]
-    results = svc.search(query=query, columns=["CHUNK_TEXT", "FILE_NAME"], limit=limit)
+    if retrieval.startswith("Hybrid"):
+        results = hybrid_search(service_path, query, ["CHUNK_TEXT", "FILE_NAME"], limit,
+                                keyword_weight=keyword_weight, vector_weight=vector_weight)
+    else:
+        # Falls back to the local index from Day 20 if the service can't be reached
+        results, _ = search(session, service_path, query, columns=["CHUNK_TEXT", "FILE_NAME"], limit=limit,
+                            cache=get_retrieval_cache())
     
     chunks_data = []
-    for item in results.results:
+    for item in results:
         chunks_data.append({
             "text": item.get("CHUNK_TEXT", ""),
             "source": item.get("FILE_NAME", "Unknown")
@@ -139,8 +146,7 @@ USER QUESTION: {prompt}
 
 Provide a clear, helpful answer based ONLY on the customer reviews above. If you cite information, mention it naturally."""
                     
-                    sql = f"SELECT SNOWFLAKE.CORTEX.COMPLETE('claude-3-5-sonnet', '{rag_prompt.replace(chr(39), chr(39)+chr(39))}')"
-                    response = session.sql(sql).collect()[0][0]
+                    response = cortex_complete(session, rag_prompt, "claude-3-5-sonnet")
                 
                 st.markdown(response)
                 
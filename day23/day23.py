@@ -1,16 +1,17 @@
 import streamlit as st
-from snowflake.core import Root
 import json
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import cortex_complete
+from shared.retrieval_cache import get_retrieval_cache
+from shared.search import search
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Initialize session state for run counter
 if 'run_counter' not in st.session_state:
@@ -226,11 +227,9 @@ if run_evaluation:
                 @instrument()
                 def retrieve_context(self, query: str) -> str:
                     """Retrieve context from Cortex Search."""
-                    root = Root(self.session)
-                    parts = self.search_service.split(".")
-                    svc = root.databases[parts[0]].schemas[parts[1]].cortex_search_services[parts[2]]
-                    results = svc.search(query=query, columns=["CHUNK_TEXT"], limit=self.num_results)
-                    context = "\n\n".join([r["CHUNK_TEXT"] for r in results.results])
+                    results, _ = search(self.session, self.search_service, query, ["CHUNK_TEXT"],
+                                        self.num_results, cache=get_retrieval_cache())
+                    context = "\n\n".join([r["CHUNK_TEXT"] for r in results])
                     return context
                 
                 @instrument()
@@ -244,10 +243,7 @@ Question: {query}
 
 Provide a helpful answer based on the context above:"""
                     
-                    prompt_escaped = prompt.replace("'", "''")
-                    response = self.session.sql(
-                        f"SELECT SNOWFLAKE.CORTEX.COMPLETE('{self.model}', '{prompt_escaped}')"
-                    ).collect()[0][0]
+                    response = cortex_complete(self.session, prompt, self.model)
                     return response.strip()
                 
                 @instrument()
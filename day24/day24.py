@@ -1,16 +1,16 @@
 import streamlit as st
 import io
 import time
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import complete_file
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Initialize state
 if "image_database" not in st.session_state:
@@ -169,16 +169,7 @@ with st.container(border=True):
             with st.spinner(f":material/psychology: Analyzing with {model}..."):
                 try:
                     # Use AI_COMPLETE with TO_FILE syntax
-                    sql_query = f"""
-                    SELECT SNOWFLAKE.CORTEX.AI_COMPLETE(
-                        '{model}',
-                        '{prompt.replace("'", "''")}',
-                        TO_FILE('{stage_name}', '{filename}')
-                    ) as analysis
-                    """
-                    
-                    result = session.sql(sql_query).collect()
-                    response = result[0]['ANALYSIS']
+                    response = complete_file(session, prompt, stage_name, filename, model)
                     
                     # Store results in session state
                     st.session_state.analysis_response = response
@@ -1,43 +1,41 @@
 import streamlit as st
 import json
-from snowflake.snowpark.functions import ai_complete
 import io
 import time
 import hashlib
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cortex import complete
+from shared.memory import ConversationMemory
+from shared.session import get_session
+from shared.transcript import Transcript
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 def call_llm(prompt_text: str) -> str:
     """Call Snowflake Cortex LLM."""
-    df = session.range(1).select(
-        ai_complete(model="claude-3-5-sonnet", prompt=prompt_text).alias("response")
-    )
-    response_raw = df.collect()[0][0]
-    response_json = json.loads(response_raw)
-    if isinstance(response_json, dict):
-        return response_json.get("choices", [{}])[0].get("messages", "")
-    return str(response_json)
+    return complete(session, prompt_text, model="claude-3-5-sonnet")
 
 # Initialize state
 if "voice_messages" not in st.session_state:
-    st.session_state.voice_messages = []
+    st.session_state.voice_messages = Transcript(separator="\n")
 
 # Ensure welcome message is always present
 if len(st.session_state.voice_messages) == 0:
-    st.session_state.voice_messages = [
+    st.session_state.voice_messages = Transcript([
         {
             "role": "assistant",
             "content": "Hello! :material/waving_hand: I'm your voice-enabled AI assistant. Click the microphone button in the sidebar to record a message, and I'll respond to you!"
         }
-    ]
+    ], separator="\n")
+
+# Conversation memory: recent turns verbatim, older ones summarized
+if "voice_memory" not in st.session_state:
+    st.session_state.voice_memory = ConversationMemory(model="claude-3-5-sonnet")
 
 if "voice_database" not in st.session_state:
     st.session_state.voice_database = "RAG_DB"
@@ -128,12 +126,13 @@ CREATE STAGE {full_stage_name}
                 st.caption("Use the ':material/autorenew: Recreate Stage' button above")
     
     if st.button(":material/delete: Clear Chat"):
-        st.session_state.voice_messages = [
+        st.session_state.voice_memory.reset()
+        st.session_state.voice_messages = Transcript([
             {
                 "role": "assistant",
                 "content": "Hello! :material/waving_hand: I'm your voice-enabled AI assistant. Click the microphone button in the sidebar to record a message, and I'll respond to you!"
             }
-        ]
+        ], separator="\n")
         st.rerun()
 
 # Display chat history FIRST (before processing)
@@ -238,18 +237,9 @@ SELECT SNOWFLAKE.CORTEX.AI_TRANSCRIBE(
                     # Build conversation history for context
                     conversation_context = "You are a friendly voice assistant. Keep responses short and conversational.\n\nConversation history:\n"
                     
-                    # Add previous messages (excluding the welcome message if it's the only one)
-                    history_messages = st.session_state.voice_messages[:-1] if len(st.session_state.voice_messages) > 1 else []
-                    
-                    # Skip welcome message in history
-                    history_messages = [msg for msg in history_messages if not (msg["role"] == "assistant" and "Click the microphone button" in msg["content"])]
-                    
-                    for msg in history_messages:
-                        role = "User" if msg["role"] == "user" else "Assistant"
-                        conversation_context += f"{role}: {msg['content']}\n"
-                    
-                    # Add current user message
-                    conversation_context += f"\nUser: {transcript}\n\nAssistant:"
+                    # Recent history plus a summary of older turns, within a token budget
+                    conversation_context += st.session_state.voice_memory.context(session, st.session_state.voice_messages)
+                    conversation_context += "\n\nAssistant:"
                     
                     response = call_llm(conversation_context)
                     
@@ -1,13 +1,14 @@
 #Day26
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 st.title(":material/smart_toy: Introduction to Cortex Agents")
 st.write("Learn how to create Cortex Agents with Cortex Search on sales conversations.")
@@ -1,13 +1,14 @@
 #Day26 - Simplified (Cortex Search Only)
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 st.title(":material/smart_toy: Cortex Agent with Search")
 st.write("Create a Cortex Agent using **Cortex Search** to answer questions about sales conversations.")
@@ -1,19 +1,21 @@
 import json
 import streamlit as st
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session, rest_credentials
 
 # Environment detection and connection setup
+session = get_session()
 IS_SIS = False
 try:
-    from snowflake.snowpark.context import get_active_session
     import _snowflake
-    session = get_active_session()
     IS_SIS = True
 except:
     import requests
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
-    conn = session._conn._conn
-    HOST, TOKEN = conn.host, conn.rest.token
+    HOST, TOKEN = rest_credentials(session)
 
 # Config
 DB_NAME = "CHANINN_SALES_INTELLIGENCE"
@@ -1,18 +1,17 @@
 import streamlit as st
 from snowflake.cortex import Complete
 import time
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session
 
 st.title(":material/airwave: Write Streams")
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create() 
+session = get_session()
 
 llm_models = ["claude-3-5-sonnet", "mistral-large", "llama3.1-8b"]
 model= st.selectbox("Select a model", llm_models)
@@ -5,16 +5,15 @@ from langchain_core.output_parsers import PydanticOutputParser
 from langchain_snowflake import ChatSnowflake
 from pydantic import BaseModel, Field
 from typing import Literal
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Define output schema
 class PlantRecommendation(BaseModel):
@@ -1,30 +1,21 @@
 import streamlit as st
 import time
-import json
-from snowflake.snowpark.functions import ai_complete
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cache import get_completion_cache
+from shared.cortex import complete
+from shared.session import get_session
 
 st.title(":material/cached: Caching your App")
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 @st.cache_data
 def call_cortex_llm(prompt_text):
-    model = "claude-3-5-sonnet"
-    df = session.range(1).select(
-        ai_complete(model=model, prompt=prompt_text).alias("response")
-    )
-    
-    # Get and parse response
-    response_raw = df.collect()[0][0]
-    response_json = json.loads(response_raw)
-    return response_json
+    return complete(session, prompt_text, model="claude-3-5-sonnet", cache=get_completion_cache())
 
 prompt = st.text_input("Enter your prompt", "Why is the sky blue?")
 
@@ -34,6 +25,8 @@ if st.button("Submit"):
     end_time = time.time()
     
     st.success(f"*Call took {end_time - start_time:.2f} seconds*")
+    cache_stats = get_completion_cache().stats()
+    st.caption(f"Persistent cache: {cache_stats['hits']} hit(s), {cache_stats['misses']} miss(es)")
     st.write(response)
 
 # Footer
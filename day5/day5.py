@@ -1,30 +1,21 @@
 import streamlit as st
-import json
-from snowflake.snowpark.functions import ai_complete
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cache import get_completion_cache
+from shared.cortex import complete
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Cached LLM Function
 @st.cache_data
 def call_cortex_llm(prompt_text):
     """Makes a call to Cortex AI with the given prompt."""
-    model = "claude-3-5-sonnet"
-    df = session.range(1).select(
-        ai_complete(model=model, prompt=prompt_text).alias("response")
-    )
-    
-    # Get and parse response
-    response_raw = df.collect()[0][0]
-    response_json = json.loads(response_raw)
-    return response_json
+    return complete(session, prompt_text, model="claude-3-5-sonnet", cache=get_completion_cache())
 
 # --- App UI ---
 st.title(":material/post: LinkedIn Post Generator")
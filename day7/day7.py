@@ -1,31 +1,34 @@
 import streamlit as st
-import json
 import time
-from snowflake.snowpark.functions import ai_complete
+import sys
+from pathlib import Path
+
+# Make the repo-level shared/ package importable
+sys.path.append(str(Path(__file__).resolve().parents[1]))
+from shared.cache import get_completion_cache
+from shared.cortex import complete, complete_batch
+from shared.session import get_session
 
 # Connect to Snowflake
-try:
-    # Works in Streamlit in Snowflake
-    from snowflake.snowpark.context import get_active_session
-    session = get_active_session()
-except:
-    # Works locally and on Streamlit Community Cloud
-    from snowflake.snowpark import Session
-    session = Session.builder.configs(st.secrets["connections"]["snowflake"]).create()
+session = get_session()
 
 # Cached LLM Function
 @st.cache_data
 def call_cortex_llm(prompt_text):
     """Makes a call to Cortex AI with the given prompt."""
-    model = "claude-3-5-sonnet"
-    df = session.range(1).select(
-        ai_complete(model=model, prompt=prompt_text).alias("response")
-    )
-    
-    # Get and parse response
-    response_raw = df.collect()[0][0]
-    response_json = json.loads(response_raw)
-    return response_json
+    return complete(session, prompt_text, model="claude-3-5-sonnet", cache=get_completion_cache())
+
+def build_prompt(content, tone, word_count):
+    """Builds the LinkedIn post prompt."""
+    return f"""
+        You are an expert social media manager. Generate a LinkedIn post based on the following:
+
+        Tone: {tone}
+        Desired Length: Approximately {word_count} words
+        Use content from this URL: {content}
+
+        Generate only the LinkedIn post text. Use dash for bullet points.
+        """
 
 # --- App UI ---
 
@@ -51,15 +54,7 @@ if st.button("Generate Post"):
         # Add a slight delay
         time.sleep(2)
         
-        prompt = f"""
-        You are an expert social media manager. Generate a LinkedIn post based on the following:
-
-        Tone: {tone}
-        Desired Length: Approximately {word_count} words
-        Use content from this URL: {content}
-
-        Generate only the LinkedIn post text. Use dash for bullet points.
-        """
+        prompt = build_prompt(content, tone, word_count)
         
         # Step 2: Call API
         st.write(":material/flash_on: Generating: contacting Snowflake Cortex...")
@@ -77,4 +72,31 @@ if st.button("Generate Post"):
     # Display Result
     with st.container(border=True):
         st.subheader(":material/output: Generated post:")
-        st.markdown(response)
\ No newline at end of file
+        st.markdown(response)
+
+# Batch generation
+st.divider()
+with st.expander(":material/dynamic_feed: Batch generation"):
+    st.caption("Generate posts for many URL and tone combinations in a single Cortex query.")
+    batch_urls = st.text_area("Content URLs (one per line):", content)
+    batch_tones = st.multiselect("Tones:", ["Professional", "Casual", "Funny"], default=[tone])
+
+    if st.button("Generate Batch"):
+        jobs = [(url.strip(), batch_tone) for url in batch_urls.splitlines() if url.strip()
+                for batch_tone in batch_tones]
+
+        with st.spinner(f"Generating {len(jobs)} post(s)..."):
+            results = complete_batch(
+                session,
+                [build_prompt(url, batch_tone, word_count) for url, batch_tone in jobs],
+                model="claude-3-5-sonnet",
+                cache=get_completion_cache()
+            )
+
+        for (url, batch_tone), result in zip(jobs, results):
+            with st.container(border=True):
+                st.caption(f"{batch_tone} | {url}")
+                if result.ok:
+                    st.markdown(result.text)
+                else:
+                    st.error(result.error)
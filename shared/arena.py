@@ -0,0 +1,77 @@
+"""Concurrent model runner for side-by-side comparisons."""
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+
+from shared.cortex import complete_with_usage
+from shared.streaming import stream_complete
+from shared.tokens import estimate_usage
+
+
+@dataclass
+class ModelRun:
+    """Response, timings (seconds) and token usage for one model.
+
+    ``queue_time`` is submission to start, ``ttft`` is start to first token
+    and ``total_time`` is start to last token. ``token_source`` says whether
+    the counts were reported by Cortex or estimated locally.
+    """
+    model: str
+    response_text: str = ""
+    error: str = None
+    queue_time: float = 0.0
+    ttft: float = None
+    total_time: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    tokens_per_second: float = 0.0
+    token_source: str = None
+
+
+def run_model(session, model: str, prompt: str, submitted_at: float = None,
+              stream: bool = True) -> ModelRun:
+    """Run one model and record its timings and token usage.
+
+    Streaming measures time to first token but token counts are estimated;
+    without streaming Cortex reports exact usage but there is no TTFT.
+    """
+    start = time.perf_counter()
+    run = ModelRun(model=model, queue_time=start - (submitted_at or start))
+    usage = None
+    try:
+        if stream:
+            chunks = []
+            for delta in stream_complete(session, prompt, model=model):
+                if run.ttft is None:
+                    run.ttft = time.perf_counter() - start
+                chunks.append(delta)
+            run.response_text = "".join(chunks)
+        else:
+            run.response_text, usage = complete_with_usage(session, prompt, model=model)
+    except Exception as e:
+        run.error = str(e)
+    run.total_time = time.perf_counter() - start
+
+    usage = usage or estimate_usage(model, prompt, run.response_text)
+    run.prompt_tokens = usage.prompt_tokens
+    run.completion_tokens = usage.completion_tokens
+    run.token_source = usage.source
+    # Throughput over the generation phase only, when we know where it starts
+    run.tokens_per_second = usage.tokens_per_second(run.total_time - (run.ttft or 0.0))
+    return run
+
+
+def run_models(session, models, prompt: str, max_workers: int = None, stream: bool = True):
+    """Run ``prompt`` against every model concurrently.
+
+    Yields a ``ModelRun`` as soon as each model finishes, fastest first.
+    """
+    models = list(models)
+    if not models:
+        return
+    with ThreadPoolExecutor(max_workers=max_workers or len(models)) as pool:
+        submitted_at = time.perf_counter()
+        futures = [pool.submit(run_model, session, model, prompt, submitted_at, stream)
+                   for model in models]
+        for future in as_completed(futures):
+            yield future.result()
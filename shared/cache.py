@@ -0,0 +1,252 @@
+"""Persistent LLM completion cache.
+
+Completions are keyed on (model, normalized prompt, parameters) and stored
+either in a local SQLite file, shared by every process on the host, or in a
+Snowflake table, shared by every replica. Entries expire after a TTL and the
+least recently used ones are evicted once the cache is full.
+
+Configure it with an optional ``[llm_cache]`` section in ``secrets.toml``::
+
+    [llm_cache]
+    backend = "sqlite"          # or "snowflake"
+    path = "~/.cache/30-days-of-ai/completions.sqlite3"
+    table = "RAG_DB.RAG_SCHEMA.LLM_CACHE"
+    ttl_seconds = 604800
+    max_entries = 10000
+    evict_every = 500           # snowflake backend: writes between evictions
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+import streamlit as st
+
+DEFAULT_PATH = "~/.cache/30-days-of-ai/completions.sqlite3"
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so re-indented templates share a cache entry."""
+    return " ".join(prompt.split())
+
+
+def cache_key(model: str, prompt: str, params=None) -> str:
+    payload = json.dumps([model, normalize_prompt(prompt), params or {}], sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SQLiteBackend:
+    """Cache entries in a local SQLite file."""
+
+    def __init__(self, path: str = DEFAULT_PATH, max_entries: int = 10000):
+        self.path = os.path.expanduser(path)
+        self.max_entries = max_entries
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS completions (
+                    cache_key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS completions_lru ON completions (last_access)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get_many(self, keys, now: float) -> dict:
+        """``key -> response`` for the live entries among ``keys``."""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._connect() as conn:
+            # Stay under SQLite's bound-variable limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                marks = ", ".join("?" * len(batch))
+                found.update(conn.execute(
+                    f"SELECT cache_key, response FROM completions WHERE cache_key IN ({marks}) AND expires_at > ?",
+                    (*batch, now),
+                ).fetchall())
+            conn.executemany("UPDATE completions SET last_access = ? WHERE cache_key = ?",
+                             [(now, key) for key in found])
+        return found
+
+    def set_many(self, entries: dict, expires_at: float, now: float):
+        """Store ``key -> response`` entries, then evict expired and least recently used ones."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO completions VALUES (?, ?, ?, ?)",
+                [(key, response, expires_at, now) for key, response in entries.items()],
+            )
+            conn.execute("DELETE FROM completions WHERE expires_at <= ?", (now,))
+            conn.execute("""
+                DELETE FROM completions WHERE cache_key IN (
+                    SELECT cache_key FROM completions
+                    ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )
+            """, (self.max_entries,))
+
+
+class SnowflakeTableBackend:
+    """Cache entries in a Snowflake table shared by every replica."""
+
+    def __init__(self, session_provider, table: str, max_entries: int = 100000,
+                 evict_every: int = 500, batch_size: int = 500):
+        self.session_provider = session_provider
+        self.table = table
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.batch_size = batch_size
+        self._writes = 0
+        self._lock = threading.Lock()
+        self.session_provider().sql(f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                CACHE_KEY VARCHAR,
+                RESPONSE VARCHAR,
+                EXPIRES_AT FLOAT,
+                LAST_ACCESS FLOAT
+            )
+        """).collect()
+
+    def get_many(self, keys, now: float) -> dict:
+        """``key -> response`` for the live entries among ``keys``: one SELECT and one UPDATE."""
+        keys = json.dumps(list(dict.fromkeys(keys)))
+        session = self.session_provider()
+        rows = session.sql(f"""
+            SELECT CACHE_KEY, RESPONSE FROM {self.table}
+            WHERE CACHE_KEY IN (SELECT VALUE::VARCHAR FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+                AND EXPIRES_AT > ?
+        """, params=[keys, now]).collect()
+        found = {row["CACHE_KEY"]: row["RESPONSE"] for row in rows}
+        if found:
+            session.sql(f"""
+                UPDATE {self.table} SET LAST_ACCESS = ?
+                WHERE CACHE_KEY IN (SELECT VALUE::VARCHAR FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))))
+            """, params=[now, json.dumps(list(found))]).collect()
+        return found
+
+    def set_many(self, entries: dict, expires_at: float, now: float):
+        """Store ``key -> response`` entries with one MERGE per ``batch_size`` of them.
+
+        Expired and least recently used entries are evicted every
+        ``evict_every`` writes rather than on each one, since that scans the
+        whole table.
+        """
+        session = self.session_provider()
+        items = list(entries.items())
+        for start in range(0, len(items), self.batch_size):
+            session.sql(f"""
+                MERGE INTO {self.table} t
+                USING (
+                    SELECT f.VALUE[0]::VARCHAR AS CACHE_KEY, f.VALUE[1]::VARCHAR AS RESPONSE
+                    FROM TABLE(FLATTEN(INPUT => PARSE_JSON(?))) f
+                ) s
+                ON t.CACHE_KEY = s.CACHE_KEY
+                WHEN MATCHED THEN UPDATE SET
+                    RESPONSE = s.RESPONSE, EXPIRES_AT = ?, LAST_ACCESS = ?
+                WHEN NOT MATCHED THEN INSERT VALUES (s.CACHE_KEY, s.RESPONSE, ?, ?)
+            """, params=[json.dumps(items[start:start + self.batch_size]), expires_at, now, expires_at, now]).collect()
+
+        with self._lock:
+            self._writes += len(items)
+            evict = self._writes >= self.evict_every
+            if evict:
+                self._writes = 0
+        if evict:
+            self.evict(now)
+
+    def evict(self, now: float):
+        """Delete expired entries and all but the ``max_entries`` most recently used."""
+        self.session_provider().sql(f"""
+            DELETE FROM {self.table} WHERE EXPIRES_AT <= ? OR CACHE_KEY IN (
+                SELECT CACHE_KEY FROM {self.table}
+                QUALIFY ROW_NUMBER() OVER (ORDER BY LAST_ACCESS DESC) > ?
+            )
+        """, params=[now, self.max_entries]).collect()
+
+
+class CompletionCache:
+    """TTL cache in front of a storage backend, with hit/miss counters."""
+
+    def __init__(self, backend, ttl_seconds: float = 7 * 24 * 3600):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, model: str, prompt: str, params=None):
+        return self.get_many(model, [prompt], params)[0]
+
+    def get_many(self, model: str, prompts, params=None) -> list:
+        """Cached completion for each prompt, or None, with one backend lookup for all of them."""
+        keys = [cache_key(model, prompt, params) for prompt in prompts]
+        found = self.backend.get_many(keys, time.time()) if keys else {}
+        responses = [found.get(key) for key in keys]
+        with self._lock:
+            hits = sum(response is not None for response in responses)
+            self.hits += hits
+            self.misses += len(responses) - hits
+        return responses
+
+    def set(self, model: str, prompt: str, response: str, params=None):
+        self.set_many(model, [(prompt, response)], params)
+
+    def set_many(self, model: str, completions, params=None):
+        """Cache ``(prompt, response)`` pairs with one backend write."""
+        entries = {cache_key(model, prompt, params): response for prompt, response in completions}
+        if entries:
+            now = time.time()
+            self.backend.set_many(entries, now + self.ttl_seconds, now)
+
+    def get_or_complete(self, model: str, prompt: str, complete_fn, params=None) -> str:
+        """Return the cached completion, or call ``complete_fn()`` and cache it."""
+        response = self.get(model, prompt, params)
+        if response is None:
+            response = complete_fn()
+            self.set(model, prompt, response, params)
+        return response
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+
+@st.cache_resource
+def get_completion_cache() -> CompletionCache:
+    """Return the process-wide completion cache configured in secrets."""
+    try:
+        config = dict(st.secrets.get("llm_cache", {}))
+    except Exception:
+        # No secrets.toml, e.g. in Streamlit in Snowflake
+        config = {}
+    ttl_seconds = config.get("ttl_seconds", 7 * 24 * 3600)
+
+    if config.get("backend") == "snowflake":
+        from shared.session import get_session
+        backend = SnowflakeTableBackend(
+            get_session,
+            config.get("table", "RAG_DB.RAG_SCHEMA.LLM_CACHE"),
+            config.get("max_entries", 100000),
+            config.get("evict_every", 500),
+        )
+    else:
+        backend = SQLiteBackend(config.get("path", DEFAULT_PATH), config.get("max_entries", 10000))
+    return CompletionCache(backend, ttl_seconds)
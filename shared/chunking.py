@@ -0,0 +1,384 @@
+"""Column-wise document chunking for RAG.
+
+Word offsets for every document are found with one array pass over the
+concatenated texts. Chunk boundaries are then computed as arrays over all
+documents at once and turned into a chunk DataFrame without building a dict
+per chunk.
+
+Strategies, all with ``chunk_size`` and ``overlap`` in the strategy's unit:
+
+- ``words``: fixed windows of words.
+- ``sentences``: whole sentences packed up to ``chunk_size`` words, with
+  about ``overlap`` words of trailing sentences repeated in the next chunk.
+- ``tokens``: words packed up to ``chunk_size`` estimated tokens.
+
+Chunk IDs are derived from the document's file name and content hash, the
+chunking parameters and the chunk's offset, so rechunking unchanged content
+reproduces the same IDs and embeddings keyed on CHUNK_ID stay valid. The
+parameters are also stored with each chunk (``CHUNK_PARAMS``), so incremental
+runs rechunk documents last chunked with other settings. Saving merges on
+CHUNK_ID and tombstones (``IS_DELETED``) chunks that are no longer produced
+instead of deleting them.
+"""
+import hashlib
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from shared.cortex import DEFAULT_MODEL
+from shared.loader import write_rows
+from shared.tokens import chars_per_token
+
+STRATEGIES = ("words", "sentences", "tokens")
+
+# Lookup table of the code points str.split() treats as whitespace (all below U+3001);
+# its last entry is False so larger code points can be clipped onto it
+_IS_SPACE = np.array([chr(c).isspace() for c in range(0x3002)])
+_SENTENCE_END = np.array([ord(c) for c in ".!?"], dtype=np.uint32)
+
+CHUNK_COLUMNS = ["CHUNK_ID", "DOC_ID", "FILE_NAME", "CHUNK_TEXT", "CHUNK_SIZE", "CHUNK_TYPE", "CONTENT_HASH",
+                 "CHUNK_PARAMS"]
+
+
+def chunk_params(strategy: str, chunk_size: int, overlap: int) -> str:
+    """Canonical ``strategy|size|overlap`` key that chunk IDs are derived from."""
+    if not chunk_size:
+        return "document|0|0"
+    return f"{strategy}|{chunk_size}|{overlap}"
+
+
+def check_overlap(chunk_size: int, overlap: int):
+    """Raise ``ValueError`` unless ``0 <= overlap < chunk_size`` (``chunk_size=None`` keeps whole documents)."""
+    if chunk_size is not None and not 0 <= overlap < chunk_size:
+        raise ValueError(f"Overlap must be at least 0 and less than the chunk size ({chunk_size}), got {overlap}")
+
+
+def stable_chunk_id(file_name: str, content_hash: str, params: str, start_char: int) -> int:
+    """63-bit chunk ID: the first 64 bits of SHA-256 over
+    ``file_name|content_hash|params|start_char``, halved to fit a signed
+    BIGINT. ``chunk_in_snowflake`` computes the same value in SQL.
+    """
+    key = f"{file_name}|{content_hash}|{params}|{start_char}"
+    return int(hashlib.sha256(key.encode("utf-8")).hexdigest()[:16], 16) >> 1
+
+
+def _words(texts):
+    """Locate every word of every text in one pass over their concatenation.
+
+    Returns ``(doc, starts, ends, last_chars)`` arrays with one entry per
+    word; offsets are relative to the word's own document.
+    """
+    joined = "\n".join(texts)
+    codes = np.frombuffer(joined.encode("utf-32-le"), dtype=np.uint32)
+    # ASCII whitespace with plain comparisons; the table only for the (rare) non-ASCII characters
+    is_space = (codes == 0x20) | ((codes >= 0x09) & (codes <= 0x0D)) | ((codes >= 0x1C) & (codes <= 0x1F))
+    non_ascii = np.flatnonzero(codes >= 0x80)
+    is_space[non_ascii] = _IS_SPACE[np.minimum(codes[non_ascii], len(_IS_SPACE) - 1)]
+    # Word boundaries alternate start, end, start, end...
+    edges = np.flatnonzero(np.diff(np.concatenate([[True], is_space, [True]])))
+    starts, ends = edges[0::2], edges[1::2]
+    text_starts = np.cumsum([0] + [len(text) + 1 for text in texts[:-1]])
+    first_word = np.searchsorted(starts, text_starts)
+    doc = np.repeat(np.arange(len(texts)), np.diff(np.append(first_word, len(starts))))
+    return doc, starts - text_starts[doc], ends - text_starts[doc], codes[ends - 1]
+
+
+def _units(texts, strategy: str, model: str):
+    """Return ``(doc, char_starts, char_ends, weights, words)`` arrays, one entry per unit."""
+    doc, starts, ends, last_chars = _words(texts)
+    words = np.ones(len(doc), dtype=np.int64)
+    if strategy == "tokens":
+        weights = np.ceil((ends - starts) / chars_per_token(model)).astype(np.int64)
+        return doc, starts, ends, weights, words
+    if strategy == "sentences":
+        # A sentence ends at a word ending in . ! or ?, or at the end of its document
+        is_end = np.isin(last_chars, _SENTENCE_END)
+        is_end[-1:] = True
+        is_end[:-1] |= doc[1:] != doc[:-1]
+        last = np.flatnonzero(is_end)
+        first = np.concatenate([[0], last + 1])[:-1].astype(np.int64)
+        sentence_words = last - first + 1
+        return doc[first], starts[first], ends[last], sentence_words, sentence_words
+    return doc, starts, ends, words, words
+
+
+def _pack(weights, chunk_size: int, overlap: int):
+    """Greedy windows over weighted units, as ``(starts, ends)`` unit indexes."""
+    cum = np.cumsum(weights)
+    n = len(cum)
+    starts, ends = [], []
+    start = 0
+    while True:
+        base = cum[start - 1] if start else 0
+        end = max(int(np.searchsorted(cum, base + chunk_size, side="right")), start + 1)
+        starts.append(start)
+        ends.append(min(end, n))
+        if end >= n:
+            break
+        # First unit such that the units from it to ``end`` weigh at most ``overlap``
+        start = max(int(np.searchsorted(cum, cum[end - 1] - overlap, side="left")) + 1, start + 1)
+    return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+
+
+def chunk_documents(df: pd.DataFrame, strategy: str = "words", chunk_size: int = 200,
+                    overlap: int = 50, text_column: str = "EXTRACTED_TEXT",
+                    model: str = DEFAULT_MODEL) -> pd.DataFrame:
+    """Split every document in ``df`` into chunks.
+
+    ``chunk_size=None`` keeps each document as a single chunk. Documents
+    that fit in one chunk keep their full text with ``chunk_type``
+    ``full_review``; the others are split into ``chunked_review`` chunks.
+    Returns one row per chunk with ``doc_id``, ``file_name``, ``chunk_id``
+    (see ``stable_chunk_id``), ``chunk_text``, ``chunk_size`` (words),
+    ``chunk_type``, ``content_hash``, ``chunk_params`` and the chunk's ``start_char``/``end_char``
+    in its document. Documents without a CONTENT_HASH are keyed on a hash of
+    their text.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f"Unknown chunking strategy: {strategy}")
+    check_overlap(chunk_size, overlap)
+    texts = df[text_column].fillna("").to_numpy(dtype=object)
+    unit_doc, char_starts, char_ends, weights, words = _units(list(texts), strategy, model)
+    unit_counts = np.bincount(unit_doc, minlength=len(texts))
+    unit_offsets = np.concatenate([[0], np.cumsum(unit_counts)])
+    words_cum = np.concatenate([[0], np.cumsum(words)])
+
+    # Chunk boundaries as unit indexes within each document
+    if chunk_size is None:
+        doc_index = np.arange(len(texts))
+        unit_start = np.zeros(len(texts), dtype=np.int64)
+        unit_end = unit_counts
+    elif strategy == "words":
+        # Uniform weights: closed form, no per-document loop
+        step = max(chunk_size - overlap, 1)
+        chunk_counts = np.where(
+            unit_counts <= chunk_size, 1, -(-(unit_counts - overlap) // step)
+        )
+        doc_index = np.repeat(np.arange(len(texts)), chunk_counts)
+        first_chunk = np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+        unit_start = (np.arange(len(doc_index)) - first_chunk) * step
+        unit_end = np.minimum(unit_start + chunk_size, unit_counts[doc_index])
+    else:
+        packed = [
+            _pack(weights[unit_offsets[i]:unit_offsets[i + 1]], chunk_size, overlap)
+            for i in range(len(texts))
+        ]
+        doc_index = np.repeat(np.arange(len(texts)), [len(p[0]) for p in packed])
+        unit_start = np.concatenate([p[0] for p in packed]) if packed else np.zeros(0, dtype=np.int64)
+        unit_end = np.concatenate([p[1] for p in packed]) if packed else np.zeros(0, dtype=np.int64)
+
+    single = np.bincount(doc_index, minlength=len(texts))[doc_index] == 1
+    doc_texts = texts[doc_index]
+    # Single-chunk documents keep their full text; split ones are sliced at word/sentence offsets
+    start_char = np.zeros(len(doc_index), dtype=np.int64)
+    end_char = np.array([len(text) for text in doc_texts], dtype=np.int64)
+    split = ~single & (unit_end > unit_start)
+    start_char[split] = char_starts[(unit_offsets[doc_index] + unit_start)[split]]
+    end_char[split] = char_ends[(unit_offsets[doc_index] + unit_end - 1)[split]]
+    chunk_text = [text[s:e] for text, s, e in zip(doc_texts, start_char, end_char)]
+
+    hashes = df["CONTENT_HASH"].to_numpy(dtype=object) if "CONTENT_HASH" in df else np.full(len(texts), None)
+    hashes = np.array([h or hashlib.sha256(text.encode("utf-8")).hexdigest()
+                       for h, text in zip(hashes, texts)], dtype=object)
+    file_names = df["FILE_NAME"].to_numpy()[doc_index]
+    params = chunk_params(strategy, chunk_size, overlap)
+    chunk_ids = np.array([stable_chunk_id(name, h, params, s)
+                          for name, h, s in zip(file_names, hashes[doc_index], start_char)], dtype=np.int64)
+
+    return pd.DataFrame({
+        "doc_id": df["DOC_ID"].to_numpy()[doc_index],
+        "file_name": file_names,
+        "chunk_id": chunk_ids,
+        "chunk_text": chunk_text,
+        "chunk_size": words_cum[unit_offsets[doc_index] + unit_end] - words_cum[unit_offsets[doc_index] + unit_start],
+        "chunk_type": np.where(single, "full_review", "chunked_review"),
+        "content_hash": hashes[doc_index],
+        "chunk_params": params,
+        "start_char": start_char,
+        "end_char": end_char,
+    })
+
+
+def ensure_chunk_table(session, chunk_table: str):
+    """Create the chunk table, adding columns missing from older versions."""
+    session.sql(f"""
+        CREATE TABLE IF NOT EXISTS {chunk_table} (
+            CHUNK_ID NUMBER,
+            DOC_ID NUMBER,
+            FILE_NAME VARCHAR,
+            CHUNK_TEXT VARCHAR,
+            CHUNK_SIZE NUMBER,
+            CHUNK_TYPE VARCHAR,
+            CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP(),
+            CONTENT_HASH VARCHAR,
+            IS_DELETED BOOLEAN DEFAULT FALSE,
+            CHUNK_PARAMS VARCHAR
+        )
+    """).collect()
+    session.sql(f"ALTER TABLE {chunk_table} ADD COLUMN IF NOT EXISTS CONTENT_HASH VARCHAR").collect()
+    session.sql(f"ALTER TABLE {chunk_table} ADD COLUMN IF NOT EXISTS IS_DELETED BOOLEAN DEFAULT FALSE").collect()
+    session.sql(f"ALTER TABLE {chunk_table} ADD COLUMN IF NOT EXISTS CHUNK_PARAMS VARCHAR").collect()
+
+
+def unchunked_condition(chunk_table: str, content_hash: str = "d.CONTENT_HASH", match_params: bool = True) -> str:
+    """SQL condition that a source row ``d`` has no live chunks for its current content.
+
+    With ``match_params``, only chunks made with the parameters bound to the
+    condition's ``?`` (see ``chunk_params``) count.
+    """
+    params = " AND e.CHUNK_PARAMS = ?" if match_params else ""
+    return f"""NOT EXISTS (
+            SELECT 1 FROM {chunk_table} e
+            WHERE e.DOC_ID = d.DOC_ID AND e.CONTENT_HASH = {content_hash}{params}
+                AND NOT COALESCE(e.IS_DELETED, FALSE)
+        )"""
+
+
+def _apply_chunks(session, stage: str, chunk_table: str, source_table: str):
+    """Merge staged chunks into ``chunk_table`` and tombstone the stale ones.
+
+    Staged chunks are deduplicated by CHUNK_ID first. New CHUNK_IDs are
+    inserted and tombstoned ones that were produced again are restored. Live chunks are then tombstoned if their document is gone
+    from ``source_table``, or if their document was rechunked and they were
+    not produced this time. Returns ``(inserted, restored, tombstoned)``.
+    """
+    columns = ", ".join(CHUNK_COLUMNS)
+    # Documents duplicated in the source (same file and content under several
+    # DOC_IDs) produce the same CHUNK_IDs; each chunk is kept once, for the lowest DOC_ID
+    session.sql(f"""
+        DELETE FROM {chunk_table} t
+        USING (
+            SELECT CHUNK_ID, MIN(DOC_ID) AS KEEP_DOC_ID FROM {chunk_table}
+            WHERE CHUNK_ID IN (SELECT CHUNK_ID FROM {stage})
+            GROUP BY CHUNK_ID HAVING COUNT(*) > 1
+        ) d
+        WHERE t.CHUNK_ID = d.CHUNK_ID AND t.DOC_ID > d.KEEP_DOC_ID
+    """).collect()
+    merged = session.sql(f"""
+        MERGE INTO {chunk_table} t
+        USING (
+            SELECT * FROM {stage}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY CHUNK_ID ORDER BY DOC_ID) = 1
+        ) s
+        ON t.CHUNK_ID = s.CHUNK_ID
+        WHEN MATCHED AND (COALESCE(t.IS_DELETED, FALSE) OR t.DOC_ID IS DISTINCT FROM s.DOC_ID
+                          OR t.CHUNK_PARAMS IS DISTINCT FROM s.CHUNK_PARAMS) THEN UPDATE SET
+            DOC_ID = s.DOC_ID, CHUNK_PARAMS = s.CHUNK_PARAMS, IS_DELETED = FALSE
+        WHEN NOT MATCHED THEN INSERT ({columns}, IS_DELETED)
+            VALUES ({", ".join(f"s.{c}" for c in CHUNK_COLUMNS)}, FALSE)
+    """).collect()
+    tombstoned = session.sql(f"""
+        UPDATE {chunk_table} t SET IS_DELETED = TRUE
+        WHERE NOT COALESCE(t.IS_DELETED, FALSE) AND (
+            t.DOC_ID NOT IN (SELECT DOC_ID FROM {source_table})
+            OR (t.DOC_ID IN (SELECT DOC_ID FROM {stage})
+                AND t.CHUNK_ID NOT IN (SELECT CHUNK_ID FROM {stage}))
+        )
+    """).collect()
+    return merged[0][0], merged[0][1], tombstoned[0][0]
+
+
+def _stage_name(chunk_table: str) -> str:
+    return f"{chunk_table}_STAGE_{uuid.uuid4().hex[:8].upper()}"
+
+
+def save_chunks(session, chunks: pd.DataFrame, chunk_table: str, source_table: str, **write_options):
+    """Save ``chunk_documents`` output to ``chunk_table`` by CHUNK_ID.
+
+    Chunks are bulk loaded into a temporary stage with ``write_rows`` and
+    applied as described in ``_apply_chunks``, so unchanged chunks keep their
+    rows (and embeddings). Returns ``(inserted, restored, tombstoned)``.
+    """
+    stage = _stage_name(chunk_table)
+    session.sql(f"CREATE TEMPORARY TABLE {stage} LIKE {chunk_table}").collect()
+    try:
+        rows = chunks.rename(columns=str.upper)[CHUNK_COLUMNS].to_dict("records")
+        write_rows(session, rows, stage, **write_options)
+        return _apply_chunks(session, stage, chunk_table, source_table)
+    finally:
+        session.sql(f"DROP TABLE IF EXISTS {stage}").collect()
+
+
+def _word_chunker():
+    """Build the UDTF handler class.
+
+    It is defined locally so Snowpark pickles it by value: the server has
+    neither this module nor numpy, so the handler only uses the standard
+    library. Boundaries and START_CHAR offsets match
+    ``chunk_documents(strategy="words")``.
+    """
+    class WordChunker:
+        def process(self, text, chunk_size, overlap):
+            import re
+            text = text or ""
+            spans = [m.span() for m in re.finditer(r"\S+", text)]
+            n = len(spans)
+            if not chunk_size or n <= chunk_size:
+                yield (0, text, n, "full_review")
+                return
+            step = max(chunk_size - overlap, 1)
+            for k in range(-(-(n - overlap) // step)):
+                start = k * step
+                end = min(start + chunk_size, n)
+                yield (spans[start][0], text[spans[start][0]:spans[end - 1][1]], end - start, "chunked_review")
+
+    return WordChunker
+
+
+def chunk_in_snowflake(session, source_table: str, chunk_table: str, chunk_size: int = 200,
+                       overlap: int = 50, incremental: bool = False):
+    """Chunk documents inside Snowflake, so document text never leaves it.
+
+    Word windows are computed by a temporary Python UDTF into a temporary
+    stage with one CREATE TABLE ... AS SELECT, with the same CHUNK_IDs as
+    ``chunk_documents``, then applied like ``save_chunks``. ``chunk_size=None``
+    keeps whole documents. With ``incremental``, only documents without live
+    chunks for their current content and these parameters are chunked. Returns
+    ``(inserted, restored, tombstoned)``.
+    """
+    from snowflake.snowpark.types import IntegerType, StringType, StructField, StructType
+
+    # The UDTF would silently drop documents longer than chunk_size but not than overlap
+    check_overlap(chunk_size or None, overlap)
+    database, schema, _ = chunk_table.split(".")
+    udtf_name = f"{database}.{schema}.CHUNK_WORDS"
+    session.udtf.register(
+        _word_chunker(),
+        output_schema=StructType([
+            StructField("START_CHAR", IntegerType()),
+            StructField("CHUNK_TEXT", StringType()),
+            StructField("CHUNK_SIZE", IntegerType()),
+            StructField("CHUNK_TYPE", StringType()),
+        ]),
+        input_types=[StringType(), IntegerType(), IntegerType()],
+        name=udtf_name,
+        is_permanent=False,
+        replace=True,
+    )
+
+    content_hash = "COALESCE(d.CONTENT_HASH, SHA2(d.EXTRACTED_TEXT, 256))"
+    params = chunk_params("words", chunk_size, overlap)
+    # In statement order: CHUNK_ID, CHUNK_PARAMS, the UDTF's arguments, then the WHERE clause
+    binds = [params, params, chunk_size or 0, overlap if chunk_size else 0]
+    where = ""
+    if incremental:
+        where = f"WHERE {unchunked_condition(chunk_table, content_hash)}"
+        binds.append(params)
+
+    stage = _stage_name(chunk_table)
+    session.sql(f"""
+        CREATE TEMPORARY TABLE {stage} AS
+        SELECT
+            FLOOR(TO_NUMBER(LEFT(SHA2(CONCAT_WS('|', d.FILE_NAME, {content_hash}, ?, c.START_CHAR), 256), 16),
+                            'XXXXXXXXXXXXXXXX') / 2)::NUMBER AS CHUNK_ID,
+            d.DOC_ID, d.FILE_NAME, c.CHUNK_TEXT, c.CHUNK_SIZE, c.CHUNK_TYPE, {content_hash} AS CONTENT_HASH,
+            ?::VARCHAR AS CHUNK_PARAMS
+        FROM {source_table} d,
+            TABLE({udtf_name}(d.EXTRACTED_TEXT, ?, ?)) c
+        {where}
+    """, params=binds).collect()
+    try:
+        return _apply_chunks(session, stage, chunk_table, source_table)
+    finally:
+        session.sql(f"DROP TABLE IF EXISTS {stage}").collect()
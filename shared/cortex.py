@@ -0,0 +1,176 @@
+"""Cortex AI_COMPLETE helpers.
+
+``complete_batch`` sends many prompts in a single query: the prompts become
+rows of one Snowpark DataFrame and ``ai_complete`` runs across all of them,
+so N prompts cost one warehouse round trip instead of N.
+
+``cortex_complete`` and ``complete_file`` pass the prompt as a bind
+parameter: the statement text is the same for every prompt, so it is
+compiled once and reused, and no quoting of the prompt is needed.
+
+The prompt entry points accept an optional ``CompletionCache`` (see
+``shared.cache``); cached prompts never reach the warehouse.
+"""
+import json
+from dataclasses import dataclass
+
+from snowflake.snowpark.functions import ai_complete, col
+
+from shared.tokens import estimate_usage, usage_from_response
+
+DEFAULT_MODEL = "claude-3-5-sonnet"
+
+_COMPLETE_SQL = "SELECT SNOWFLAKE.CORTEX.COMPLETE(?, ?) AS RESPONSE"
+_COMPLETE_FILE_SQL = "SELECT SNOWFLAKE.CORTEX.AI_COMPLETE(?, ?, TO_FILE(?, ?)) AS RESPONSE"
+
+
+@dataclass
+class Completion:
+    """Result for one prompt of a batch."""
+    prompt: str
+    text: str = None
+    error: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def parse_response(response_raw) -> str:
+    """Extract the generated text from a raw AI_COMPLETE result."""
+    return _response_text(json.loads(response_raw))
+
+
+def _response_text(response_json) -> str:
+    if isinstance(response_json, dict):
+        return response_json.get("choices", [{}])[0].get("messages", "")
+    return str(response_json)
+
+
+def complete(session, prompt: str, model: str = DEFAULT_MODEL, cache=None) -> str:
+    """Run a single prompt through AI_COMPLETE and return the text."""
+    def run():
+        df = session.range(1).select(
+            ai_complete(model=model, prompt=prompt).alias("response")
+        )
+        return parse_response(df.collect()[0][0])
+
+    if cache is None:
+        return run()
+    return cache.get_or_complete(model, prompt, run)
+
+
+def cortex_complete(session, prompt: str, model: str = DEFAULT_MODEL, cache=None) -> str:
+    """Run a single prompt through COMPLETE with the prompt and model bound, and return the text."""
+    def run():
+        return session.sql(_COMPLETE_SQL, params=[model, prompt]).collect()[0][0]
+
+    if cache is None:
+        return run()
+    return cache.get_or_complete(model, prompt, run)
+
+
+def complete_file(session, prompt: str, stage: str, file_name: str, model: str = DEFAULT_MODEL) -> str:
+    """Run a prompt about a staged file (e.g. an image) through AI_COMPLETE and return the text."""
+    return session.sql(_COMPLETE_FILE_SQL, params=[model, prompt, stage, file_name]).collect()[0][0]
+
+
+def complete_with_usage(session, prompt: str, model: str = DEFAULT_MODEL):
+    """Run a single prompt and return ``(text, TokenUsage)``.
+
+    Usage comes from the response details when Cortex reports it and is
+    estimated locally otherwise.
+    """
+    df = session.range(1).select(
+        ai_complete(model=model, prompt=prompt, show_details=True).alias("response")
+    )
+    response_json = json.loads(df.collect()[0][0])
+    text = _response_text(response_json)
+    usage = usage_from_response(response_json) or estimate_usage(model, prompt, text)
+    return text, usage
+
+
+def with_completion(df, prompt_column: str, model: str = DEFAULT_MODEL,
+                    output_column: str = "RESPONSE"):
+    """Add an AI_COMPLETE column to a Snowpark DataFrame (lazy, no query yet)."""
+    return df.with_column(output_column, ai_complete(model=model, prompt=col(prompt_column)))
+
+
+def complete_batch(session, prompts, model: str = DEFAULT_MODEL, cache=None) -> list:
+    """Complete many prompts in one query.
+
+    Returns one ``Completion`` per prompt, in input order. If the batch query
+    fails, it is split in half and retried so a bad row only fails itself;
+    a failure shared by both halves is reported for every row at once.
+    """
+    prompts = [str(p) for p in prompts]
+    results = [Completion(prompt=p) for p in prompts]
+
+    # One cache lookup and one cache write for the whole batch
+    cached = cache.get_many(model, prompts) if cache is not None else [None] * len(prompts)
+    pending = []
+    for idx, (prompt, text) in enumerate(zip(prompts, cached)):
+        if text is None:
+            pending.append((idx, prompt))
+        else:
+            results[idx].text = text
+
+    if pending:
+        _run_batch(session, pending, model, results)
+        if cache is not None:
+            cache.set_many(model, [(results[idx].prompt, results[idx].text)
+                                   for idx, _ in pending if results[idx].ok])
+    return results
+
+
+def _run_batch(session, rows, model, results):
+    error = _try_batch(session, rows, model, results)
+    if error is not None:
+        _bisect(session, rows, model, results, error)
+
+
+def _try_batch(session, rows, model, results):
+    """Complete ``rows`` in one query; returns the exception if the query failed."""
+    try:
+        df = session.create_dataframe(rows, schema=["IDX", "PROMPT"])
+        collected = with_completion(df, "PROMPT", model).select("IDX", "RESPONSE").collect()
+    except Exception as e:
+        return e
+
+    for row in collected:
+        result = results[row["IDX"]]
+        if row["RESPONSE"] is None:
+            result.error = "Empty response"
+            continue
+        try:
+            result.text = parse_response(row["RESPONSE"])
+        except ValueError as e:
+            result.error = f"Unreadable response: {e}"
+    return None
+
+
+def _error_kind(error):
+    # Messages embed query IDs, so compare the exception type and Snowflake error code
+    return type(error), getattr(error, "sql_error_code", None)
+
+
+def _bisect(session, rows, model, results, error):
+    """Find the rows of a failed batch that fail on their own.
+
+    If both halves fail the same way as the whole batch, the failure is
+    systemic (unknown model, missing privilege, suspended warehouse) rather
+    than a bad row, and every row gets the error without further queries.
+    """
+    if len(rows) == 1:
+        results[rows[0][0]].error = str(error)
+        return
+    middle = len(rows) // 2
+    halves = [rows[:middle], rows[middle:]]
+    errors = [_try_batch(session, half, model, results) for half in halves]
+    if all(e is not None and _error_kind(e) == _error_kind(error) for e in errors):
+        for idx, _ in rows:
+            results[idx].error = str(errors[0])
+        return
+    for half, half_error in zip(halves, errors):
+        if half_error is not None:
+            _bisect(session, half, model, results, half_error)
@@ -0,0 +1,114 @@
+"""Batched Cortex embedding generation for review chunks.
+
+``embed_in_snowflake`` embeds chunks where they are stored: one set-based
+INSERT ... SELECT calls EMBED_TEXT_768 on every chunk missing an embedding,
+so neither text nor vectors pass through the app. ``embed_texts`` is the client-side fallback:
+each batch of texts is embedded in one query and batches run concurrently.
+Its vectors are saved with ``save_embeddings``, a bulk load rather than an
+INSERT per vector.
+"""
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+
+from shared.loader import write_rows
+
+# Also imported by the local vector store and index, so this module must
+# import without Snowpark; Snowpark functions are imported where they are used
+EMBED_MODEL = "snowflake-arctic-embed-m"
+EMBEDDING_DIM = 768
+
+
+def ensure_embedding_table(session, table: str, replace: bool = False):
+    create = "CREATE OR REPLACE TABLE" if replace else "CREATE TABLE IF NOT EXISTS"
+    session.sql(f"""
+        {create} {table} (
+            CHUNK_ID NUMBER,
+            EMBEDDING VECTOR(FLOAT, {EMBEDDING_DIM}),
+            CREATED_TIMESTAMP TIMESTAMP_NTZ DEFAULT CURRENT_TIMESTAMP()
+        )
+    """).collect()
+
+
+def embed_in_snowflake(session, chunk_table: str, embedding_table: str, model: str = EMBED_MODEL,
+                       missing_only: bool = True) -> int:
+    """Embed live chunks straight into ``embedding_table`` with one INSERT ... SELECT.
+
+    Only chunks without an embedding are embedded, unless ``missing_only``
+    is off, in which case the embeddings of every live chunk are deleted and
+    recomputed. Returns the number of embeddings written.
+    """
+    live = f"SELECT CHUNK_ID FROM {chunk_table} WHERE NOT COALESCE(IS_DELETED, FALSE)"
+    if not missing_only:
+        session.sql(f"DELETE FROM {embedding_table} WHERE CHUNK_ID IN ({live})").collect()
+    result = session.sql(f"""
+        INSERT INTO {embedding_table} (CHUNK_ID, EMBEDDING)
+        SELECT c.CHUNK_ID, SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, c.CHUNK_TEXT)
+        FROM {chunk_table} c
+        WHERE NOT COALESCE(c.IS_DELETED, FALSE)
+            AND NOT EXISTS (SELECT 1 FROM {embedding_table} e WHERE e.CHUNK_ID = c.CHUNK_ID)
+    """, params=[model]).collect()
+    return result[0][0]
+
+
+def _embed_batch(session, rows, model):
+    from snowflake.snowpark.functions import call_function, col, lit
+
+    df = session.create_dataframe(rows, schema=["IDX", "TEXT"])
+    embedded = df.select(
+        "IDX", call_function("SNOWFLAKE.CORTEX.EMBED_TEXT_768", lit(model), col("TEXT")).alias("EMBEDDING")
+    ).collect()
+    # VECTOR values may come back as JSON text depending on the connector version
+    return {row["IDX"]: json.loads(row["EMBEDDING"]) if isinstance(row["EMBEDDING"], str) else list(row["EMBEDDING"])
+            for row in embedded}
+
+
+def embed_texts(session, texts, batch_size: int = 50, max_workers: int = 4,
+                model: str = EMBED_MODEL, on_batch=None) -> list:
+    """Embed ``texts`` in batches of one query each, ``max_workers`` at a time.
+
+    Returns a float32 ``(len(texts), EMBEDDING_DIM)`` matrix, rows in input
+    order. ``on_batch(done, total)`` is called as batches complete.
+    """
+    rows = [(idx, str(text)) for idx, text in enumerate(texts)]
+    batches = [rows[start:start + batch_size] for start in range(0, len(rows), batch_size)]
+    embeddings = np.zeros((len(rows), EMBEDDING_DIM), dtype=np.float32)
+    done = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_embed_batch, session, batch, model): batch for batch in batches}
+        for future in as_completed(futures):
+            for idx, embedding in future.result().items():
+                embeddings[idx] = embedding
+            done += len(futures[future])
+            if on_batch:
+                on_batch(done, len(rows))
+    return embeddings
+
+
+def save_embeddings(session, chunk_ids, vectors, table: str, batch_size: int = 5000, on_batch=None) -> int:
+    """Bulk save ``vectors`` for ``chunk_ids`` into an existing embeddings table.
+
+    Vectors are packed as float32 arrays and loaded into a temporary ARRAY
+    stage with ``write_rows`` (Parquet files and COPY INTO), then moved into
+    ``table`` with one INSERT ... SELECT casting to VECTOR, replacing any
+    existing rows for the same chunks. Returns the number of rows saved.
+    """
+    database, schema, name = table.split(".")
+    stage = f"{database}.{schema}.{name}_STAGE_{uuid.uuid4().hex[:8].upper()}"
+    session.sql(f"CREATE TEMPORARY TABLE {stage} (CHUNK_ID NUMBER, EMBEDDING ARRAY)").collect()
+    try:
+        rows = ({"CHUNK_ID": int(chunk_id), "EMBEDDING": np.asarray(vector, dtype=np.float32)}
+                for chunk_id, vector in zip(chunk_ids, vectors))
+        if not write_rows(session, rows, stage, batch_size=batch_size, on_batch=on_batch):
+            return 0
+        session.sql(f"DELETE FROM {table} WHERE CHUNK_ID IN (SELECT CHUNK_ID FROM {stage})").collect()
+        result = session.sql(f"""
+            INSERT INTO {table} (CHUNK_ID, EMBEDDING)
+            SELECT CHUNK_ID, EMBEDDING::VECTOR(FLOAT, {EMBEDDING_DIM})
+            FROM {stage}
+        """).collect()
+        return result[0][0]
+    finally:
+        session.sql(f"DROP TABLE IF EXISTS {stage}").collect()
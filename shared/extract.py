@@ -0,0 +1,159 @@
+"""Parallel text extraction for uploaded documents.
+
+Files, and page ranges of large PDFs, are extracted in a process pool so
+work spreads across cores; even opening a PDF happens in a worker. Results come back in upload order, and a file
+that takes longer than its timeout is reported as failed instead of
+stalling the batch. Input is consumed lazily and only a few files are in
+flight at once, so memory does not grow with the size of the batch.
+"""
+import io
+import multiprocessing
+import os
+import time
+from collections import deque
+from dataclasses import dataclass
+
+from pypdf import PdfReader
+
+PAGES_PER_TASK = 20
+
+
+@dataclass
+class ExtractResult:
+    index: int
+    file_name: str
+    file_type: str
+    file_size: int
+    text: str = ""
+    error: str = None
+
+
+def file_type(file_name: str) -> str:
+    name = file_name.lower()
+    if name.endswith(".txt"):
+        return "TXT"
+    if name.endswith(".md"):
+        return "Markdown"
+    if name.endswith(".pdf"):
+        return "PDF"
+    return "Unknown"
+
+
+def _page_ranges(page_count: int, pages_per_task: int, max_tasks: int):
+    """Split pages into contiguous ranges of at least ``pages_per_task``, at most ``max_tasks`` of them."""
+    tasks = max(1, min(max_tasks, -(-page_count // pages_per_task)))
+    bounds = [page_count * i // tasks for i in range(tasks + 1)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def _page_text(reader, start: int, stop: int) -> str:
+    page_texts = (reader.pages[i].extract_text() for i in range(start, stop))
+    return "".join(page_text + "\n\n" for page_text in page_texts if page_text)
+
+
+def _extract(file_name: str, data: bytes, pages=None) -> str:
+    """Worker: extract text from a whole file or a ``(start, stop)`` page range."""
+    if file_type(file_name) != "PDF":
+        return data.decode("utf-8")
+    reader = PdfReader(io.BytesIO(data))
+    return _page_text(reader, *(pages or (0, len(reader.pages))))
+
+
+def _extract_pdf_head(data: bytes, pages_per_task: int, max_tasks: int):
+    """Worker: count a PDF's pages and extract its first range.
+
+    Returns ``(text, ranges)``. Parsing happens here rather than in the app,
+    so a malformed PDF is bounded by the file's timeout.
+    """
+    reader = PdfReader(io.BytesIO(data))
+    ranges = _page_ranges(len(reader.pages), pages_per_task, max_tasks)
+    return _page_text(reader, *ranges[0]), ranges
+
+
+class _Pending:
+    """A queued file and the async results of its parts.
+
+    A PDF's first task also finds its page ranges; the other ranges are
+    queued as soon as it returns. There are at most ``max_tasks`` ranges, so
+    each worker receives and parses the file's bytes at most once.
+    """
+
+    def __init__(self, index: int, file_name: str, data: bytes, pages_per_task: int, max_tasks: int):
+        self.result = ExtractResult(index, file_name, file_type(file_name), len(data))
+        self.data = data
+        self.pages_per_task = pages_per_task
+        self.max_tasks = max_tasks
+        self.head = None
+        self.parts = []
+
+    def submit(self, pool):
+        self.parts = []
+        if self.result.file_type != "PDF":
+            self.head = pool.apply_async(_extract, (self.result.file_name, self.data))
+            return
+        # The callback runs before ``head.get()`` returns, so the rest are queued by then
+        self.head = pool.apply_async(
+            _extract_pdf_head, (self.data, self.pages_per_task, self.max_tasks),
+            callback=lambda head, pool=pool: self._submit_rest(pool, head[1]),
+        )
+
+    def _submit_rest(self, pool, ranges):
+        self.parts = [pool.apply_async(_extract, (self.result.file_name, self.data, pages))
+                      for pages in ranges[1:]]
+
+    def collect(self, timeout: float) -> ExtractResult:
+        """Wait for every part; raises ``multiprocessing.TimeoutError``."""
+        deadline = time.monotonic() + timeout
+        try:
+            head = self.head.get(timeout)
+            texts = [head[0] if self.result.file_type == "PDF" else head]
+            texts += [part.get(max(0.0, deadline - time.monotonic())) for part in self.parts]
+            self.result.text = "".join(texts)
+        except multiprocessing.TimeoutError:
+            raise
+        except Exception as e:
+            self.result.error = str(e)
+        return self.result
+
+
+def extract_files(files, processes: int = None, timeout: float = 120,
+                  pages_per_task: int = PAGES_PER_TASK, max_in_flight: int = None):
+    """Extract text from an iterable of ``(file_name, data)`` pairs in parallel.
+
+    Yields an ``ExtractResult`` per file, in input order. At most
+    ``max_in_flight`` files (default twice the pool size) are read and queued
+    ahead of the one being yielded. ``timeout`` is how long to wait for a file
+    once the files before it are done. When a file times out its workers are
+    terminated and the files queued behind it are resubmitted to a fresh
+    pool, so a stuck PDF can't starve the rest of the batch.
+    """
+    processes = processes or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * processes
+    pending = deque()
+    pool = multiprocessing.Pool(processes=processes)
+
+    def next_result():
+        nonlocal pool
+        entry = pending.popleft()
+        try:
+            return entry.collect(timeout)
+        except multiprocessing.TimeoutError:
+            entry.result.error = f"Timed out after {timeout:.0f}s"
+            pool.terminate()
+            pool = multiprocessing.Pool(processes=processes)
+            for waiting in pending:
+                waiting.submit(pool)
+            return entry.result
+
+    try:
+        for index, (file_name, data) in enumerate(files):
+            entry = _Pending(index, file_name, data, pages_per_task, processes)
+            entry.submit(pool)
+            pending.append(entry)
+            if len(pending) >= max_in_flight:
+                yield next_result()
+        while pending:
+            yield next_result()
+    finally:
+        # Stops workers still busy if the caller gave up early
+        pool.terminate()
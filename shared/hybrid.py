@@ -0,0 +1,150 @@
+"""Hybrid keyword + vector retrieval over review chunks.
+
+A BM25 inverted index catches exact product names and order IDs that
+embeddings blur together, exact vector search catches paraphrases, and
+reciprocal-rank fusion merges the two rankings without having to calibrate
+their scores against each other.
+"""
+import re
+
+import numpy as np
+import streamlit as st
+
+from shared.embeddings import EMBED_MODEL
+from shared.similarity import row_norms, top_k
+from shared.vector_index import SearchResults, cortex_query_embedder, load_chunk_embeddings
+
+# Words, numbers and hyphenated/underscored codes such as "TG-2041" or "ORD_88213"
+_TOKEN = re.compile(r"[a-z0-9]+(?:[-_][a-z0-9]+)*")
+
+
+def tokenize(text: str) -> list:
+    return _TOKEN.findall((text or "").lower())
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed set of documents.
+
+    Postings are stored term by term in flat arrays, each with its BM25
+    weight precomputed, so scoring a query is one ``bincount`` over the
+    postings of its terms.
+    """
+
+    def __init__(self, ids, texts, k1: float = 1.5, b: float = 0.75):
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.vocabulary = {}
+        doc_terms, term_ids = [], []
+        for text in texts:
+            tokens = tokenize(text)
+            doc_terms.append(len(tokens))
+            term_ids.extend(self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens)
+        lengths = np.asarray(doc_terms, dtype=np.int64)
+        docs = np.repeat(np.arange(len(lengths)), lengths)
+
+        # One posting per (term, document) pair, sorted by term
+        pairs, tf = np.unique(np.asarray(term_ids, dtype=np.int64) * len(lengths) + docs, return_counts=True)
+        terms, self.postings = np.divmod(pairs, max(len(lengths), 1))
+        df = np.bincount(terms, minlength=len(self.vocabulary))
+        self.offsets = np.concatenate([[0], np.cumsum(df)])
+        idf = np.log(1 + (len(lengths) - df + 0.5) / (df + 0.5))
+        norm = k1 * (1 - b + b * lengths / max(lengths.mean() if len(lengths) else 0, 1e-9))
+        self.weights = (idf[terms] * tf * (k1 + 1) / (tf + norm[self.postings])).astype(np.float32)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        """BM25 score of every document, in input order."""
+        terms = {self.vocabulary[t] for t in tokenize(query) if t in self.vocabulary}
+        if not terms:
+            return np.zeros(len(self.ids), dtype=np.float32)
+        postings = np.concatenate([np.arange(self.offsets[t], self.offsets[t + 1]) for t in terms])
+        return np.bincount(self.postings[postings], weights=self.weights[postings],
+                           minlength=len(self.ids)).astype(np.float32)
+
+    def search(self, query: str, k: int = 10):
+        """Top-``k`` ``(ids, scores)``, best first; documents sharing no term are left out."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores > 0)
+        k = min(k, len(matched))
+        if not k:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float32)
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return self.ids[top], scores[top]
+
+
+def reciprocal_rank_fusion(rankings, weights=None, k: int = 60, limit: int = None):
+    """Fuse ranked id lists: each id scores ``sum(weight / (k + rank))`` over the lists it is in.
+
+    Returns ``(ids, scores)`` best first, at most ``limit`` of them.
+    """
+    weights = [1.0] * len(rankings) if weights is None else weights
+    rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+    ids = np.concatenate(rankings) if rankings else np.zeros(0, dtype=np.int64)
+    contributions = np.concatenate([
+        np.full(len(ranking), weight) / (k + np.arange(1, len(ranking) + 1))
+        for ranking, weight in zip(rankings, weights)
+    ]) if rankings else np.zeros(0)
+    unique, inverse = np.unique(ids, return_inverse=True)
+    fused = np.bincount(inverse, weights=contributions, minlength=len(unique))
+    order = np.argsort(-fused, kind="stable")[:limit]
+    return unique[order], fused[order]
+
+
+class HybridRetriever:
+    """BM25 and exact vector search over the same chunks, fused with RRF.
+
+    ``keyword_weight`` and ``vector_weight`` scale each ranking's share of
+    the fused score; ``candidates`` results are taken from each side before
+    fusing. ``search`` matches the Cortex Search call, with the fused score
+    as ``score``.
+    """
+
+    def __init__(self, chunks: dict, store, embed_query, keyword_weight: float = 1.0,
+                 vector_weight: float = 1.0, rrf_k: int = 60, candidates: int = 50):
+        self.chunks = chunks
+        self.store = store
+        self.norms = row_norms(store.vectors)
+        self.bm25 = BM25Index(list(chunks), (chunk.get("CHUNK_TEXT") for chunk in chunks.values()))
+        self.embed_query = embed_query
+        self.keyword_weight = keyword_weight
+        self.vector_weight = vector_weight
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+
+    def rank(self, query: str, limit: int = 10, keyword_weight: float = None, vector_weight: float = None):
+        """Fused ``(ids, scores)``; the weights override the retriever's own for this call."""
+        keyword_ids, _ = self.bm25.search(query, self.candidates)
+        rows, _ = top_k(self.store.vectors, self.embed_query(query), self.candidates, norms=self.norms)
+        return reciprocal_rank_fusion(
+            [keyword_ids, self.store.ids[rows[0]]],
+            weights=[
+                self.keyword_weight if keyword_weight is None else keyword_weight,
+                self.vector_weight if vector_weight is None else vector_weight,
+            ],
+            k=self.rrf_k,
+            limit=limit,
+        )
+
+    def search(self, query: str, columns, limit: int = 10, keyword_weight: float = None,
+               vector_weight: float = None, **kwargs) -> SearchResults:
+        ids, scores = self.rank(query, limit, keyword_weight, vector_weight)
+        return SearchResults([
+            {**{c: self.chunks[int(chunk_id)].get(c) for c in columns}, "score": float(score)}
+            for chunk_id, score in zip(ids, scores)
+        ])
+
+
+@st.cache_resource(show_spinner="Indexing chunks for hybrid search...", ttl=600)
+def get_hybrid_retriever(embedding_table: str, chunk_table: str, model: str = EMBED_MODEL) -> HybridRetriever:
+    """Build a retriever over the current chunks, kept per table pair for up to ten minutes.
+
+    Days 17 and 18 clear it after saving chunks or embeddings, so new ones
+    are searchable straight away.
+    """
+    from shared.session import get_session
+
+    chunks, store = load_chunk_embeddings(get_session(), embedding_table, chunk_table, model)
+    # Queries are embedded with the calling user's session, not the one that built the index
+    return HybridRetriever(chunks, store, lambda text: cortex_query_embedder(get_session(), model)(text))
@@ -0,0 +1,91 @@
+"""Bulk loading of rows into Snowflake tables."""
+import hashlib
+import uuid
+
+import pandas as pd
+
+DEFAULT_BATCH_SIZE = 10000
+DEFAULT_BATCH_BYTES = 64 * 1024 * 1024
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _text_size(row: dict) -> int:
+    return sum(len(value) for value in row.values() if isinstance(value, str))
+
+
+def write_rows(session, rows, table: str, batch_size: int = DEFAULT_BATCH_SIZE,
+               max_batch_bytes: int = DEFAULT_BATCH_BYTES, on_batch=None) -> int:
+    """Append dict rows to an existing ``DATABASE.SCHEMA.TABLE``.
+
+    Rows are sent in batches with ``write_pandas``, which stages each batch as
+    a file and loads it with one COPY INTO, so values never pass through SQL
+    text. A batch is flushed at ``batch_size`` rows or once its text reaches
+    roughly ``max_batch_bytes``, whichever comes first, so a generator of rows
+    is loaded in constant memory. Keys must match column names (uppercase);
+    omitted columns get their defaults. ``on_batch(rows_written)`` is called
+    after each batch. Returns the number of rows written.
+    """
+    database, schema, name = table.split(".")
+    written = 0
+    batch = []
+    batch_bytes = 0
+
+    def flush():
+        nonlocal written, batch, batch_bytes
+        session.write_pandas(
+            pd.DataFrame(batch),
+            name,
+            database=database,
+            schema=schema,
+            quote_identifiers=False,
+        )
+        written += len(batch)
+        batch = []
+        batch_bytes = 0
+        if on_batch:
+            on_batch(written)
+
+    for row in rows:
+        batch.append(row)
+        batch_bytes += _text_size(row)
+        if len(batch) >= batch_size or batch_bytes >= max_batch_bytes:
+            flush()
+    if batch:
+        flush()
+    return written
+
+
+def merge_rows(session, rows, table: str, key_columns, columns, hash_column: str = "CONTENT_HASH",
+               touch_column: str = None, **write_options):
+    """Upsert dict rows into ``table`` through a temporary staging table.
+
+    Rows are bulk loaded into the stage with ``write_rows`` and applied with a
+    single MERGE on ``key_columns``: new keys are inserted, and existing ones
+    are updated only when ``hash_column`` differs, setting ``touch_column``
+    (if given) to the current timestamp. Returns ``(inserted, updated)``.
+    """
+    database, schema, name = table.split(".")
+    stage = f"{database}.{schema}.{name}_STAGE_{uuid.uuid4().hex[:8].upper()}"
+    session.sql(f"CREATE TEMPORARY TABLE {stage} LIKE {table}").collect()
+    try:
+        if not write_rows(session, rows, stage, **write_options):
+            return 0, 0
+        on = " AND ".join(f"t.{c} = s.{c}" for c in key_columns)
+        updates = [f"{c} = s.{c}" for c in columns if c not in key_columns]
+        if touch_column:
+            updates.append(f"{touch_column} = CURRENT_TIMESTAMP()")
+        result = session.sql(f"""
+            MERGE INTO {table} t
+            USING {stage} s
+            ON {on}
+            WHEN MATCHED AND t.{hash_column} IS DISTINCT FROM s.{hash_column} THEN UPDATE SET
+                {", ".join(updates)}
+            WHEN NOT MATCHED THEN INSERT ({", ".join(columns)})
+                VALUES ({", ".join(f"s.{c}" for c in columns)})
+        """).collect()
+        return result[0][0], result[0][1]
+    finally:
+        session.sql(f"DROP TABLE IF EXISTS {stage}").collect()
@@ -0,0 +1,81 @@
+"""Local manifest of the content loaded into a document table.
+
+Records the content hash last loaded for each file, so unchanged uploads
+can be skipped before they are extracted or sent to Snowflake. The manifest
+also records a fingerprint of the table (row count and latest
+UPLOAD_TIMESTAMP); it is trusted while the table's fingerprint matches, and
+reseeded from the table when it doesn't, e.g. after the table was dropped
+or another replica loaded documents.
+"""
+import json
+import os
+
+DEFAULT_DIR = "~/.cache/30-days-of-ai/manifests"
+
+
+class Manifest:
+    """``file name -> content hash`` for one table, kept in a JSON file."""
+
+    def __init__(self, table: str, directory: str = DEFAULT_DIR):
+        self.path = os.path.join(os.path.expanduser(directory), f"{table.upper()}.json")
+        self.exists = os.path.exists(self.path)
+        self.hashes = {}
+        self.fingerprint = None
+        if self.exists:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if "hashes" in data:
+                self.hashes, self.fingerprint = data["hashes"], data.get("fingerprint")
+            else:
+                # Manifests written before fingerprints were recorded
+                self.hashes = data
+
+    def is_unchanged(self, file_name: str, content_hash: str) -> bool:
+        return self.hashes.get(file_name) == content_hash
+
+    def update(self, hashes: dict, fingerprint: str = None):
+        """Record loaded files, and the table's fingerprint after loading them."""
+        self.hashes.update(hashes)
+        self.fingerprint = fingerprint
+        self.save()
+
+    def clear(self):
+        self.hashes = {}
+        self.fingerprint = None
+        self.save()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"fingerprint": self.fingerprint, "hashes": self.hashes}, f)
+        os.replace(tmp_path, self.path)
+        self.exists = True
+
+
+def table_fingerprint(session, table: str):
+    """``"rows|latest upload"`` of ``table``, or None if it can't be read."""
+    try:
+        row = session.sql(f"SELECT COUNT(*) AS N, MAX(UPLOAD_TIMESTAMP) AS LAST FROM {table}").collect()[0]
+    except Exception:
+        return None
+    return f"{row['N']}|{row['LAST']}"
+
+
+def load_manifest(session, table: str, refresh: bool = False) -> Manifest:
+    """Return the manifest for ``table``, reseeded from the table if its fingerprint changed (or ``refresh``)."""
+    manifest = Manifest(table)
+    fingerprint = table_fingerprint(session, table)
+    if not refresh and manifest.exists and fingerprint is not None and fingerprint == manifest.fingerprint:
+        return manifest
+    try:
+        rows = session.sql(
+            f"SELECT FILE_NAME, CONTENT_HASH FROM {table} WHERE CONTENT_HASH IS NOT NULL"
+        ).collect()
+        manifest.hashes = {row["FILE_NAME"]: row["CONTENT_HASH"] for row in rows}
+    except Exception:
+        # Table (or its CONTENT_HASH column) doesn't exist yet
+        manifest.hashes = {}
+    manifest.fingerprint = fingerprint
+    manifest.save()
+    return manifest
@@ -0,0 +1,82 @@
+"""Token-budgeted conversation memory for the chatbots.
+
+The last few messages are kept verbatim. Older ones are folded into a rolling
+summary that is updated incrementally, so each fold only sends the new
+messages and the previous summary to the LLM, never the whole history.
+"""
+from shared.cortex import DEFAULT_MODEL, complete
+from shared.tokens import count_tokens
+from shared.transcript import format_message
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and an assistant.
+Keep names, facts, decisions and open questions; drop small talk. Answer with the updated summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}
+
+Updated summary:"""
+
+
+class ConversationMemory:
+    """Recent messages verbatim plus a rolling summary, within a token budget.
+
+    Messages are folded into the summary once more than ``2 * keep_last`` are
+    pending, or sooner when the verbatim window exceeds ``max_tokens``; each
+    fold leaves the last ``keep_last`` messages untouched.
+    """
+
+    def __init__(self, model: str = DEFAULT_MODEL, max_tokens: int = 3000,
+                 keep_last: int = 6, summary_words: int = 200):
+        self.model = model
+        self.max_tokens = max_tokens
+        self.keep_last = keep_last
+        self.summary_words = summary_words
+        self.reset()
+
+    def reset(self):
+        self.summary = ""
+        self.summarized = 0  # Messages already folded into the summary
+        self._token_counts = []  # Per message, counted once
+
+    def _window_start(self, transcript) -> int:
+        """Index of the first message to keep verbatim."""
+        for line in transcript.lines[len(self._token_counts):]:
+            self._token_counts.append(count_tokens(line, self.model))
+
+        start = self.summarized
+        if len(transcript) - start > 2 * self.keep_last:
+            start = len(transcript) - self.keep_last
+        budget = self.max_tokens - count_tokens(self.summary, self.model)
+        # Always keep the latest message, even if it alone is over budget
+        while start < len(transcript) - 1 and sum(self._token_counts[start:]) > budget:
+            start = max(start + 1, len(transcript) - self.keep_last)
+        return start
+
+    def _fold(self, session, messages):
+        self.summary = complete(session, SUMMARY_PROMPT.format(
+            max_words=self.summary_words,
+            summary=self.summary or "(none yet)",
+            messages="\n\n".join(format_message(m) for m in messages),
+        ), model=self.model).strip()
+
+    def context(self, session, transcript) -> str:
+        """Return the conversation text to send with the next prompt.
+
+        ``transcript`` is the full chat history as a ``Transcript``; folding
+        happens here, at most once per call.
+        """
+        if len(transcript) < len(self._token_counts):
+            # History was cleared or replaced
+            self.reset()
+        start = self._window_start(transcript)
+        if start > self.summarized:
+            self._fold(session, transcript[self.summarized:start])
+            self.summarized = start
+
+        recent = transcript.render(self.summarized)
+        if self.summary:
+            return f"Summary of the earlier conversation:\n{self.summary}\n\n{recent}"
+        return recent
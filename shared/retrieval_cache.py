@@ -0,0 +1,169 @@
+"""In-process cache of Cortex Search results.
+
+Results are keyed on (service, normalized query, columns, limit, filter)
+and kept for the service's TARGET_LAG: the index itself may be that stale,
+so a cached answer is no worse than a fresh one. Optionally, a miss is
+retried as a semantic lookup: a cached query whose embedding is close
+enough to the new one answers it too.
+
+Configure it with an optional ``[retrieval_cache]`` section in ``secrets.toml``::
+
+    [retrieval_cache]
+    max_entries = 1000
+    default_ttl_seconds = 60
+    semantic_threshold = 0.95   # omit to disable semantic lookups
+"""
+import json
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import streamlit as st
+
+_LAG = re.compile(r"(\d+)\s*(second|minute|hour|day)s?", re.IGNORECASE)
+_SECONDS = {"second": 1, "minute": 60, "hour": 3600, "day": 86400}
+
+
+def normalize_query(query: str) -> str:
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return " ".join(query.lower().split()).rstrip("?!. ")
+
+
+def parse_target_lag(target_lag: str):
+    """Seconds in a TARGET_LAG such as ``"1 hour"``, or None if it can't be read."""
+    match = _LAG.search(target_lag or "")
+    return int(match.group(1)) * _SECONDS[match.group(2).lower()] if match else None
+
+
+class RetrievalCache:
+    """TTL + LRU cache of search results, with hit/miss counters.
+
+    ``embed_query(text)`` and ``semantic_threshold`` (a cosine similarity)
+    enable semantic lookups among cached queries that share the service,
+    columns, limit and filter.
+    """
+
+    def __init__(self, max_entries: int = 1000, default_ttl: float = 60,
+                 semantic_threshold: float = None, embed_query=None):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.semantic_threshold = semantic_threshold
+        self.embed_query = embed_query
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires_at, results, vector)
+        self._ttls = {}  # service -> seconds
+        self._lock = threading.Lock()
+
+    def ttl_for(self, session, service_path: str) -> float:
+        """The service's TARGET_LAG in seconds, looked up once per service."""
+        service_path = service_path.upper()
+        if service_path not in self._ttls:
+            ttl = None
+            try:
+                database, schema, name = service_path.split(".")
+                rows = session.sql(f"SHOW CORTEX SEARCH SERVICES LIKE '{name}' IN SCHEMA {database}.{schema}").collect()
+                ttl = parse_target_lag(rows[0]["target_lag"]) if rows else None
+            except Exception:
+                pass
+            self._ttls[service_path] = ttl or self.default_ttl
+        return self._ttls[service_path]
+
+    @staticmethod
+    def _key(service_path, query, columns, limit, filter):
+        return (service_path.upper(), normalize_query(query), tuple(columns), limit,
+                json.dumps(filter, sort_keys=True))
+
+    def _exact(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= now:
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    def _nearest(self, key, vector, now):
+        """Results of the closest live cached query with the same service, columns, limit and filter."""
+        best, best_score = None, self.semantic_threshold
+        for other, (expires_at, _, other_vector) in self._entries.items():
+            if other[0] == key[0] and other[2:] == key[2:] and expires_at > now and other_vector is not None:
+                score = float(vector @ other_vector)
+                if score >= best_score:
+                    best, best_score = other, score
+        if best is None:
+            return None
+        self._entries.move_to_end(best)
+        return self._entries[best][1]
+
+    def get_or_search(self, session, service_path: str, query: str, columns, limit: int,
+                      search_fn, filter=None) -> list:
+        """Return cached results, or call ``search_fn()`` and cache what it returns."""
+        now = time.time()
+        key = self._key(service_path, query, columns, limit, filter)
+        with self._lock:
+            results = self._exact(key, now)
+            if results is not None:
+                self.hits += 1
+                return results
+
+        # Only embed the query once an exact lookup has missed
+        vector = None
+        if self.semantic_threshold is not None and self.embed_query is not None:
+            vector = np.asarray(self.embed_query(key[1]), dtype=np.float32)
+            vector /= max(float(np.linalg.norm(vector)), 1e-12)
+            with self._lock:
+                results = self._nearest(key, vector, now)
+                if results is not None:
+                    self.semantic_hits += 1
+                    return results
+
+        with self._lock:
+            self.misses += 1
+        results = list(search_fn())
+        ttl = self.ttl_for(session, service_path)
+        with self._lock:
+            self._entries[key] = (now + ttl, results, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._ttls.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.semantic_hits + self.misses
+            return {
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.semantic_hits) / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+@st.cache_resource
+def get_retrieval_cache() -> RetrievalCache:
+    """Return the process-wide retrieval cache configured in secrets."""
+    try:
+        config = dict(st.secrets.get("retrieval_cache", {}))
+    except Exception:
+        # No secrets.toml, e.g. in Streamlit in Snowflake
+        config = {}
+    embed_query = None
+    if config.get("semantic_threshold") is not None:
+        from shared.session import get_session
+        from shared.vector_index import cortex_query_embedder
+
+        embed_query = lambda text: cortex_query_embedder(get_session())(text)
+    return RetrievalCache(
+        max_entries=config.get("max_entries", 1000),
+        default_ttl=config.get("default_ttl_seconds", 60),
+        semantic_threshold=config.get("semantic_threshold"),
+        embed_query=embed_query,
+    )
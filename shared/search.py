@@ -0,0 +1,121 @@
+"""Retrieval from a Cortex Search service, with a local index as fallback."""
+import threading
+import weakref
+
+import streamlit as st
+
+from shared.hybrid import get_hybrid_retriever
+from shared.vector_index import load_local_service
+
+
+def _service_parts(service_path: str):
+    parts = service_path.split(".")
+    if len(parts) != 3:
+        raise ValueError("Service path must be in format: database.schema.service_name")
+    return parts
+
+
+class ServiceRegistry:
+    """Long-lived Cortex Search service handles, one per session and service path.
+
+    Each session gets one ``Root``, and each path is resolved and checked to
+    exist once, so a search costs only the search call. A handle whose
+    search fails is dropped, and is resolved again on next use.
+    """
+
+    def __init__(self):
+        # session -> (Root, {SERVICE_PATH: handle}); entries go when their session is collected
+        self._sessions = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+
+    def _entry(self, session):
+        from snowflake.core import Root
+
+        entry = self._sessions.get(session)
+        if entry is None:
+            # Root holds only the connection, so the entry doesn't keep its weak key alive
+            entry = self._sessions[session] = (Root(session.connection), {})
+        return entry
+
+    def _validate(self, session, database: str, schema: str, name: str):
+        try:
+            rows = session.sql(f"SHOW CORTEX SEARCH SERVICES LIKE '{name}' IN SCHEMA {database}.{schema}").collect()
+        except Exception:
+            # No privilege to list services; let the search itself report problems
+            return
+        if not rows:
+            raise ValueError(f"Cortex Search service {database}.{schema}.{name} does not exist or is not visible")
+
+    def get(self, session, service_path: str):
+        database, schema, name = _service_parts(service_path)
+        key = service_path.upper()
+        with self._lock:
+            root, handles = self._entry(session)
+            handle = handles.get(key)
+        if handle is None:
+            self._validate(session, database, schema, name)
+            handle = root.databases[database].schemas[schema].cortex_search_services[name]
+            with self._lock:
+                handles[key] = handle
+        return handle
+
+    def invalidate(self, session, service_path: str):
+        with self._lock:
+            entry = self._sessions.get(session)
+            if entry is not None:
+                entry[1].pop(service_path.upper(), None)
+
+
+@st.cache_resource
+def get_service_registry() -> ServiceRegistry:
+    return ServiceRegistry()
+
+
+def cortex_search(session, service_path: str, query: str, columns, limit: int, filter=None) -> list:
+    """Search a Cortex Search service and return its result dicts."""
+    registry = get_service_registry()
+    svc = registry.get(session, service_path)
+    try:
+        if filter:
+            return svc.search(query=query, columns=columns, filter=filter, limit=limit).results
+        return svc.search(query=query, columns=columns, limit=limit).results
+    except Exception:
+        registry.invalidate(session, service_path)
+        raise
+
+
+def search(session, service_path: str, query: str, columns, limit: int, prefer_local: bool = False,
+           filter=None, cache=None):
+    """Search ``service_path``, falling back to its local index (see ``shared.vector_index``).
+
+    The local index is used when ``prefer_local`` is set, or when the
+    service call fails and an index has been built for the service.
+    Service results go through ``cache`` (a ``RetrievalCache``) if given.
+    Returns ``(results, source)`` with ``source`` either ``"cortex"`` or
+    ``"local"``.
+    """
+    _service_parts(service_path)
+    local = load_local_service(session, service_path)
+    if prefer_local and local is not None:
+        return local.search(query, columns, limit).results, "local"
+    try:
+        if cache is not None:
+            return cache.get_or_search(
+                session, service_path, query, columns, limit,
+                lambda: cortex_search(session, service_path, query, columns, limit, filter),
+                filter=filter,
+            ), "cortex"
+        return cortex_search(session, service_path, query, columns, limit, filter), "cortex"
+    except Exception:
+        if local is None:
+            raise
+        return local.search(query, columns, limit).results, "local"
+
+
+def hybrid_search(service_path: str, query: str, columns, limit: int,
+                  keyword_weight: float = 1.0, vector_weight: float = 1.0) -> list:
+    """BM25 + vector search over the REVIEW_CHUNKS and REVIEW_EMBEDDINGS next to ``service_path``."""
+    database, schema, _ = _service_parts(service_path)
+    retriever = get_hybrid_retriever(f"{database}.{schema}.REVIEW_EMBEDDINGS", f"{database}.{schema}.REVIEW_CHUNKS")
+    return retriever.search(query, columns, limit, keyword_weight=keyword_weight,
+                            vector_weight=vector_weight).results
@@ -0,0 +1,59 @@
+"""Cached discovery of the Cortex Search services visible to the app.
+
+``SHOW CORTEX SEARCH SERVICES`` is account-wide and can take seconds, so
+the list is fetched once and then served from memory. Once it is older
+than the TTL the stale list is still returned while a background thread
+refreshes it; ``invalidate`` forces the next call to fetch synchronously,
+e.g. right after a service is created.
+"""
+import threading
+import time
+
+import streamlit as st
+
+
+class ServiceCatalog:
+    """``database.schema.name`` paths of the Cortex Search services, refreshed every ``ttl_seconds``."""
+
+    def __init__(self, ttl_seconds: float = 300):
+        self.ttl_seconds = ttl_seconds
+        self._services = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+
+    def _fetch(self, session):
+        try:
+            rows = session.sql("SHOW CORTEX SEARCH SERVICES").collect()
+            services = [f"{row['database_name']}.{row['schema_name']}.{row['name']}" for row in rows]
+        except Exception:
+            # Keep serving the last good list; an empty one if there never was one
+            services = self._services if self._services is not None else []
+        with self._lock:
+            self._services = services
+            self._fetched_at = time.monotonic()
+            self._refreshing = False
+        return services
+
+    def services(self, session) -> list:
+        """Return the service paths, fetching them on first use or after ``invalidate``."""
+        with self._lock:
+            services = self._services
+            stale = time.monotonic() - self._fetched_at > self.ttl_seconds
+            refresh = services is not None and stale and not self._refreshing
+            if refresh:
+                self._refreshing = True
+        if services is None:
+            return list(self._fetch(session))
+        if refresh:
+            threading.Thread(target=self._fetch, args=(session,), daemon=True).start()
+        return list(services)
+
+    def invalidate(self):
+        with self._lock:
+            self._services = None
+
+
+@st.cache_resource
+def get_service_catalog() -> ServiceCatalog:
+    return ServiceCatalog()
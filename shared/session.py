@@ -0,0 +1,212 @@
+"""Shared Snowflake session provider.
+
+Streamlit in Snowflake hands every app an active session. Everywhere else
+(locally, Streamlit Community Cloud) we keep a small pool of warm Snowpark
+sessions, so a rerun leases an existing connection instead of logging in again.
+
+Pool sizing can be tuned with an optional ``[session_pool]`` section in
+``secrets.toml`` (any keyword argument of ``SessionPool``).
+"""
+import importlib.util
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+
+import streamlit as st
+
+
+@dataclass
+class _PooledSession:
+    session: object
+    last_used: float
+    last_checked: float
+    user_key: object = None
+    pooled: bool = True
+
+
+class SessionPool:
+    """Bounded pool of Snowpark sessions leased to Streamlit users.
+
+    Each user key keeps its lease across reruns until ``release`` or until
+    it has gone ``lease_timeout`` seconds without a rerun, and a session is
+    leased to one user at a time, since ``use_database`` and friends change
+    it for whoever holds it. A lease is never taken back while its user may
+    still be running. When every pooled session is leased and the pool is
+    full, the user gets an extra, unpooled session of their own, which is
+    closed when its lease ends; nobody waits for a session.
+    """
+
+    def __init__(self, factory, max_size=4, min_idle=1, idle_timeout=900,
+                 lease_timeout=1800, health_check_interval=300):
+        self._factory = factory
+        self.max_size = max_size
+        self.min_idle = min_idle
+        self.idle_timeout = idle_timeout
+        self.lease_timeout = lease_timeout
+        self.health_check_interval = health_check_interval
+        self._lock = threading.Lock()
+        self._entries = []
+        self._opening = 0  # Pool slots reserved by logins in progress
+        self._leases = {}  # user key -> [entry, last seen]
+
+    def lease(self, user_key):
+        """Return the session leased to ``user_key``, leasing one if needed."""
+        while True:
+            entry = self._lease_entry(user_key)
+            if time.monotonic() - entry.last_checked < self.health_check_interval or self._is_healthy(entry):
+                return entry.session
+            self._discard(entry)
+
+    def release(self, user_key):
+        """End the lease held by ``user_key``: a pooled session goes back to the pool, an extra one is closed."""
+        with self._lock:
+            lease = self._leases.pop(user_key, None)
+            entry = lease[0] if lease is not None else None
+            if entry is not None:
+                entry.user_key = None
+        if entry is not None and not entry.pooled:
+            _close(entry.session)
+
+    def stats(self):
+        """Return a snapshot of pool usage."""
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "leased": sum(1 for e in self._entries if e.user_key is not None),
+                "extra": sum(1 for entry, _ in self._leases.values() if not entry.pooled),
+                "users": len(self._leases),
+            }
+
+    def _lease_entry(self, user_key):
+        with self._lock:
+            now = time.monotonic()
+            stale = self._expire(now)
+            lease = self._leases.get(user_key)
+            if lease is None:
+                entry = self._acquire()
+                if entry is not None:
+                    lease = self._assign(entry, user_key, now)
+            if lease is not None:
+                entry = lease[0]
+                lease[1] = entry.last_used = now
+            else:
+                pooled = len(self._entries) + self._opening < self.max_size
+                if pooled:
+                    # Reserve the slot; the login happens outside the lock
+                    self._opening += 1
+        # Closing and logging in are network calls; don't hold up other users for them
+        for session in stale:
+            _close(session)
+        if lease is not None:
+            return entry
+
+        try:
+            session = self._factory()
+        except Exception:
+            if pooled:
+                with self._lock:
+                    self._opening -= 1
+            raise
+        now = time.monotonic()
+        entry = _PooledSession(session, last_used=now, last_checked=now, pooled=pooled)
+        with self._lock:
+            if pooled:
+                self._opening -= 1
+                self._entries.append(entry)
+            self._assign(entry, user_key, now)
+        return entry
+
+    def _assign(self, entry, user_key, now):
+        """Lease ``entry`` to ``user_key``. Caller holds the lock."""
+        entry.user_key = user_key
+        lease = self._leases[user_key] = [entry, now]
+        return lease
+
+    def _acquire(self):
+        """The most recently used free pooled session, or None. Caller holds the lock."""
+        free = [e for e in self._entries if e.user_key is None]
+        return max(free, key=lambda e: e.last_used) if free else None
+
+    def _expire(self, now):
+        """Drop stale leases and remove idle sessions. Caller holds the lock.
+
+        Returns the sessions to close: extra ones whose lease expired, and
+        pooled ones idle beyond ``idle_timeout`` (keeping ``min_idle`` warm).
+        """
+        stale = []
+        for key, (entry, last_seen) in list(self._leases.items()):
+            if now - last_seen > self.lease_timeout:
+                del self._leases[key]
+                entry.user_key = None
+                if not entry.pooled:
+                    stale.append(entry.session)
+
+        idle = [e for e in self._entries
+                if e.user_key is None and now - e.last_used > self.idle_timeout]
+        idle.sort(key=lambda e: e.last_used, reverse=True)
+        keep_warm = self.min_idle - (sum(1 for e in self._entries if e.user_key is None) - len(idle))
+        for entry in idle[max(keep_warm, 0):]:
+            self._entries.remove(entry)
+            stale.append(entry.session)
+        return stale
+
+    def _is_healthy(self, entry):
+        try:
+            entry.session.sql("SELECT 1").collect()
+        except Exception:
+            return False
+        entry.last_checked = time.monotonic()
+        return True
+
+    def _discard(self, entry):
+        with self._lock:
+            if entry in self._entries:
+                self._entries.remove(entry)
+            if entry.user_key is not None:
+                self._leases.pop(entry.user_key, None)
+                entry.user_key = None
+        _close(entry.session)
+
+
+def _close(session):
+    try:
+        session.close()
+    except Exception:
+        pass
+
+
+@st.cache_resource
+def _session_pool():
+    from snowflake.snowpark import Session
+
+    config = st.secrets["connections"]["snowflake"]
+    pool_options = dict(st.secrets.get("session_pool", {}))
+    return SessionPool(lambda: Session.builder.configs(config).create(), **pool_options)
+
+
+def _user_key():
+    if "_session_lease_key" not in st.session_state:
+        st.session_state._session_lease_key = uuid.uuid4().hex
+    return st.session_state._session_lease_key
+
+
+def _in_snowflake():
+    # _snowflake is only available in Streamlit in Snowflake
+    return importlib.util.find_spec("_snowflake") is not None
+
+
+def get_session():
+    """Return the Snowpark session for the current Streamlit user."""
+    if _in_snowflake():
+        from snowflake.snowpark.context import get_active_session
+        return get_active_session()
+    # Locally and on Streamlit Community Cloud. Not get_active_session(): every
+    # session the pool creates registers itself as the active one
+    return _session_pool().lease(_user_key())
+
+
+def rest_credentials(session):
+    """Return ``(host, token)`` for calling Snowflake REST APIs with ``session``."""
+    conn = session._conn._conn
+    return conn.host, conn.rest.token
@@ -0,0 +1,103 @@
+"""Exact top-k similarity search over embeddings.
+
+``top_k`` scores every stored vector with one matrix product per batch of
+queries and picks the best with ``argpartition``, so no index has to be
+built or kept in sync. ``sql_search`` runs the same search inside Snowflake
+with its VECTOR functions. Exact results are also the ground truth for
+``recall_at_k`` of an approximate index.
+"""
+import json
+
+import numpy as np
+
+from shared.embeddings import EMBED_MODEL, EMBEDDING_DIM
+
+METRICS = ("cosine", "dot", "l2")
+
+_SQL_METRICS = {
+    "cosine": ("VECTOR_COSINE_SIMILARITY", "DESC"),
+    "dot": ("VECTOR_INNER_PRODUCT", "DESC"),
+    "l2": ("VECTOR_L2_DISTANCE", "ASC"),
+}
+
+
+def row_norms(vectors) -> np.ndarray:
+    return np.linalg.norm(vectors, axis=1)
+
+
+def top_k(vectors, queries, k: int = 10, metric: str = "cosine", batch_size: int = 256, norms=None):
+    """Exact top-``k`` rows of ``vectors`` for each query.
+
+    Returns ``(indexes, scores)`` of shape ``(len(queries), k)``, best first:
+    similarities for ``cosine`` and ``dot``, distances for ``l2``. ``norms``
+    (see ``row_norms``) can be passed to avoid recomputing them per call;
+    ``vectors`` is never copied.
+    """
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric: {metric}")
+    queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+    k = min(k, len(vectors))
+    if metric != "dot" and norms is None:
+        norms = row_norms(vectors)
+    indexes = np.zeros((len(queries), k), dtype=np.int64)
+    scores = np.zeros((len(queries), k), dtype=np.float32)
+    for start in range(0, len(queries), batch_size):
+        batch = queries[start:start + batch_size]
+        products = batch @ vectors.T
+        if metric == "cosine":
+            products /= np.maximum(norms, 1e-12)
+            products /= np.maximum(row_norms(batch), 1e-12)[:, None]
+        elif metric == "l2":
+            # Negated squared distance, so larger is better as for the other metrics
+            products = 2 * products - norms ** 2 - (row_norms(batch) ** 2)[:, None]
+        if not k:
+            continue
+        best = np.argpartition(-products, k - 1, axis=1)[:, :k]
+        best_scores = np.take_along_axis(products, best, axis=1)
+        order = np.argsort(-best_scores, axis=1)
+        indexes[start:start + len(batch)] = np.take_along_axis(best, order, axis=1)
+        scores[start:start + len(batch)] = np.take_along_axis(best_scores, order, axis=1)
+    if metric == "l2":
+        scores = np.sqrt(np.maximum(-scores, 0))
+    return indexes, scores
+
+
+def exact_search(store, queries, k: int = 10, metric: str = "cosine", norms=None):
+    """``top_k`` over an ``EmbeddingStore``, returning CHUNK_IDs instead of row indexes."""
+    indexes, scores = top_k(store.vectors, queries, k, metric, norms=norms)
+    return store.ids[indexes], scores
+
+
+def recall_at_k(approximate_ids, exact_ids) -> float:
+    """Mean fraction of the exact top-k found by an approximate search, over all queries."""
+    exact_ids = np.atleast_2d(exact_ids)
+    hits = [len(np.intersect1d(found, truth)) for found, truth in zip(np.atleast_2d(approximate_ids), exact_ids)]
+    return float(np.sum(hits)) / exact_ids.size if exact_ids.size else 1.0
+
+
+def sql_search(session, embedding_table: str, chunk_table: str, query, columns, limit: int = 10,
+               metric: str = "cosine", model: str = EMBED_MODEL) -> list:
+    """Exact search pushed down to Snowflake: one scan with ORDER BY ... LIMIT.
+
+    ``query`` is text, embedded once in the statement, or a vector. Returns
+    dicts with the requested chunk ``columns`` plus ``score``, best first;
+    tombstoned chunks are skipped.
+    """
+    function, order = _SQL_METRICS[metric]
+    if isinstance(query, str):
+        query_vector, params = "SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, ?)", [model, query]
+    else:
+        query_vector = f"PARSE_JSON(?)::ARRAY::VECTOR(FLOAT, {EMBEDDING_DIM})"
+        params = [json.dumps([float(x) for x in query])]
+    rows = session.sql(f"""
+        WITH q AS (SELECT {query_vector} AS V)
+        SELECT {", ".join(f"c.{column}" for column in columns)},
+            {function}(e.EMBEDDING, q.V) AS SCORE
+        FROM {embedding_table} e
+        JOIN {chunk_table} c ON c.CHUNK_ID = e.CHUNK_ID
+        CROSS JOIN q
+        WHERE NOT COALESCE(c.IS_DELETED, FALSE)
+        ORDER BY SCORE {order}
+        LIMIT {int(limit)}
+    """, params=params).collect()
+    return [{**{column: row[column] for column in columns}, "score": row["SCORE"]} for row in rows]
@@ -0,0 +1,21 @@
+"""Incremental Cortex streaming for chat replies."""
+from snowflake.cortex import Complete
+
+from shared.cortex import DEFAULT_MODEL
+
+
+def stream_complete(session, prompt: str, model: str = DEFAULT_MODEL):
+    """Yield response text deltas as Cortex generates them.
+
+    Works directly with ``st.write_stream``, which returns the full text once
+    the stream is exhausted.
+    """
+    stream = Complete(
+        session=session,
+        model=model,
+        prompt=prompt,
+        stream=True,
+    )
+    for delta in stream:
+        if delta:
+            yield delta
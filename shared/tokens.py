@@ -0,0 +1,114 @@
+"""Token accounting for Cortex completions.
+
+Prefer the ``usage`` block that AI_COMPLETE returns with ``show_details``.
+When it is missing (e.g. streamed replies), count locally with a tokenizer
+cached per model family: ``tiktoken`` when it is installed, otherwise a
+sub-word heuristic that handles code, digits and non-English text far better
+than counting whitespace-separated words.
+"""
+import math
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Model name prefix -> tokenizer family
+_FAMILIES = [
+    ("openai", "openai"),
+    ("gpt", "openai"),
+    ("claude", "claude"),
+    ("snowflake-llama", "llama"),
+    ("llama", "llama"),
+    ("mistral", "mistral"),
+    ("mixtral", "mistral"),
+    ("pixtral", "mistral"),
+]
+
+# tiktoken encodings that match (or closely approximate) each family
+_TIKTOKEN_ENCODINGS = {"openai": "o200k_base", "llama": "cl100k_base"}
+
+# Average characters per token for ASCII words, used by the heuristic
+_CHARS_PER_TOKEN = {"claude": 3.5, "mistral": 3.7}
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|\S")
+
+
+@dataclass
+class TokenUsage:
+    prompt_tokens: int
+    completion_tokens: int
+    source: str  # "reported" or "estimated"
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def tokens_per_second(self, seconds: float) -> float:
+        return self.completion_tokens / seconds if seconds and seconds > 0 else 0.0
+
+
+def model_family(model: str) -> str:
+    name = model.lower()
+    for prefix, family in _FAMILIES:
+        if name.startswith(prefix):
+            return family
+    return "default"
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(family: str):
+    """Return a ``text -> token count`` function for a model family."""
+    if tiktoken is not None and family in _TIKTOKEN_ENCODINGS:
+        encoding = tiktoken.get_encoding(_TIKTOKEN_ENCODINGS[family])
+        return lambda text: len(encoding.encode(text, disallowed_special=()))
+
+    chars_per_token = _CHARS_PER_TOKEN.get(family, 4.0)
+
+    def estimate(text: str) -> int:
+        count = 0
+        for piece in _PIECES.findall(text):
+            if piece.isascii() and piece.isalpha():
+                count += math.ceil(len(piece) / chars_per_token)
+            elif piece.isdigit():
+                count += math.ceil(len(piece) / 3)
+            else:
+                # Punctuation, symbols and non-ASCII characters
+                count += 1
+        return count
+
+    return estimate
+
+
+def count_tokens(text: str, model: str) -> int:
+    return get_tokenizer(model_family(model))(text or "")
+
+
+def chars_per_token(model: str) -> float:
+    """Average characters per token for ASCII words, for length-based estimates."""
+    return _CHARS_PER_TOKEN.get(model_family(model), 4.0)
+
+
+def usage_from_response(response_json) -> TokenUsage:
+    """Read the ``usage`` block of a parsed AI_COMPLETE response, if present."""
+    if not isinstance(response_json, dict):
+        return None
+    usage = response_json.get("usage") or {}
+    if "completion_tokens" not in usage:
+        return None
+    return TokenUsage(
+        prompt_tokens=int(usage.get("prompt_tokens", 0)),
+        completion_tokens=int(usage["completion_tokens"]),
+        source="reported",
+    )
+
+
+def estimate_usage(model: str, prompt: str, completion: str) -> TokenUsage:
+    return TokenUsage(
+        prompt_tokens=count_tokens(prompt, model),
+        completion_tokens=count_tokens(completion, model),
+        source="estimated",
+    )
@@ -0,0 +1,46 @@
+"""Append-only chat transcript with preformatted prompt lines."""
+from collections import Counter
+
+
+def format_message(message: dict) -> str:
+    speaker = "User" if message["role"] == "user" else "Assistant"
+    return f"{speaker}: {message['content']}"
+
+
+class Transcript:
+    """Chat messages plus their formatted lines and per-role counts.
+
+    Each message is formatted once, when it is appended, so rendering only
+    joins the lines of the window asked for: its cost depends on the window,
+    not on the length of the whole history. Iterating and indexing behave
+    like the plain list of ``{"role", "content"}`` dicts it replaces.
+    """
+
+    def __init__(self, messages=(), separator: str = "\n\n"):
+        self.separator = separator
+        self.messages = []
+        self.lines = []
+        self._counts = Counter()
+        for message in messages:
+            self.append(message)
+
+    def append(self, message: dict):
+        self.messages.append(message)
+        self.lines.append(format_message(message))
+        self._counts[message["role"]] += 1
+
+    def count(self, role: str) -> int:
+        return self._counts[role]
+
+    def render(self, start: int = 0) -> str:
+        """Messages from index ``start`` on, one ``Speaker: text`` line each."""
+        return self.separator.join(self.lines[start:])
+
+    def __len__(self):
+        return len(self.messages)
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __getitem__(self, index):
+        return self.messages[index]
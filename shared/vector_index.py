@@ -0,0 +1,257 @@
+"""Local approximate nearest-neighbour search over review embeddings.
+
+``IVFIndex`` is an inverted-file index with flat (uncompressed) vectors:
+k-means splits the normalized embeddings into ``nlist`` lists, and a query
+only scans the ``nprobe`` lists whose centroids are closest to it. Raising
+``nprobe`` trades latency for recall; ``nprobe=nlist`` is an exact search.
+
+``LocalSearchService`` wraps an index and the chunk metadata behind the same
+``search(query, columns, limit)`` call as a Cortex Search service, so it can
+stand in when the service is unreachable or still indexing.
+"""
+import json
+import os
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+
+from shared.embeddings import EMBED_MODEL
+from shared.vector_store import EmbeddingStore
+
+DEFAULT_DIR = "~/.cache/30-days-of-ai/indexes"
+DEFAULT_NPROBE = 8
+
+
+def _normalize(vectors) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _nearest(vectors, centroids, batch_size: int = 8192) -> np.ndarray:
+    """Index of the most similar centroid for every vector, in batches to bound memory."""
+    return np.concatenate([
+        np.argmax(vectors[start:start + batch_size] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), batch_size)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+
+def _kmeans(vectors, nlist: int, iterations: int, seed: int) -> np.ndarray:
+    """Spherical k-means on a sample of at most 256 vectors per list."""
+    rng = np.random.default_rng(seed)
+    sample = vectors[np.sort(rng.choice(len(vectors), min(len(vectors), 256 * nlist), replace=False))]
+    centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assign = _nearest(sample, centroids)
+        order = np.argsort(assign, kind="stable")
+        counts = np.bincount(assign, minlength=nlist)
+        filled = counts > 0
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[filled]
+        centroids[filled] = _normalize(np.add.reduceat(sample[order], starts, axis=0))
+        # Empty lists restart from random sample vectors
+        centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index over normalized embeddings, scored by cosine similarity.
+
+    Vectors are kept sorted by list in an ``EmbeddingStore``, so probing a
+    list scans one contiguous block and a saved index is memory-mapped on
+    load. ``add`` appends to an unsorted tail that is searched alongside the
+    lists and folded into them on ``save``.
+    """
+
+    def __init__(self, centroids, offsets, store: EmbeddingStore, nprobe: int = DEFAULT_NPROBE):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.store = store
+        self.nprobe = nprobe
+        self._tail = EmbeddingStore(np.zeros(0), np.zeros((0, store.dim)), store.model)
+        self._tail_lists = np.zeros(0, dtype=np.int64)
+
+    @classmethod
+    def build(cls, store: EmbeddingStore, nlist: int = None, nprobe: int = DEFAULT_NPROBE,
+              iterations: int = 10, seed: int = 0) -> "IVFIndex":
+        """Train centroids on ``store`` and bucket its vectors; ``nlist`` defaults to about 4 * sqrt(n)."""
+        if not len(store):
+            raise ValueError("No embeddings to index - generate them in Day 18 first")
+        vectors = _normalize(store.vectors)
+        nlist = max(1, min(nlist or int(4 * np.sqrt(len(vectors))), len(vectors)))
+        centroids = _kmeans(vectors, nlist, iterations, seed)
+        lists = _nearest(vectors, centroids)
+        order = np.argsort(lists, kind="stable")
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=nlist))])
+        return cls(centroids, offsets, EmbeddingStore(store.ids[order], vectors[order], store.model), nprobe)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def __len__(self):
+        return len(self.store) + len(self._tail)
+
+    def add(self, ids, vectors):
+        """Insert vectors without retraining; they join the list of their nearest centroid."""
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1))
+        self._tail.append(ids, vectors)
+        self._tail_lists = np.concatenate([self._tail_lists, _nearest(vectors, self.centroids)])
+
+    def _fold_tail(self):
+        if not len(self._tail):
+            return
+        lists = np.concatenate([np.repeat(np.arange(self.nlist), np.diff(self.offsets)), self._tail_lists])
+        order = np.argsort(lists, kind="stable")
+        ids = np.concatenate([self.store.ids, self._tail.ids])[order]
+        vectors = np.concatenate([self.store.vectors, self._tail.vectors])[order]
+        self.store = EmbeddingStore(ids, vectors, self.store.model)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(lists, minlength=self.nlist))])
+        self._tail = EmbeddingStore(np.zeros(0), np.zeros((0, self.store.dim)), self.store.model)
+        self._tail_lists = np.zeros(0, dtype=np.int64)
+
+    def search(self, queries, k: int = 10, nprobe: int = None):
+        """Return ``(ids, scores)`` arrays of shape ``(len(queries), k)``, best first.
+
+        Rows are padded with id -1 and score -inf when fewer than ``k``
+        vectors are found in the probed lists.
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        ids = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, (query, probe) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate(
+                [np.arange(self.offsets[p], self.offsets[p + 1]) for p in probe]
+            ).astype(np.int64)
+            candidate_ids = self.store.ids[candidates]
+            candidate_scores = self.store.vectors[candidates] @ query
+            in_tail = np.isin(self._tail_lists, probe)
+            if in_tail.any():
+                candidate_ids = np.concatenate([candidate_ids, self._tail.ids[in_tail]])
+                candidate_scores = np.concatenate([candidate_scores, self._tail.vectors[in_tail] @ query])
+            found = min(k, len(candidate_ids))
+            if not found:
+                continue
+            top = np.argpartition(-candidate_scores, found - 1)[:found]
+            top = top[np.argsort(-candidate_scores[top])]
+            ids[row, :found] = candidate_ids[top]
+            scores[row, :found] = candidate_scores[top]
+        return ids, scores
+
+    def save(self, directory: str):
+        self._fold_tail()
+        os.makedirs(directory, exist_ok=True)
+        self.store.save(os.path.join(directory, "vectors.emb"))
+        np.savez(os.path.join(directory, "lists.npz"), centroids=self.centroids, offsets=self.offsets,
+                 nprobe=self.nprobe)
+
+    @classmethod
+    def load(cls, directory: str) -> "IVFIndex":
+        lists = np.load(os.path.join(directory, "lists.npz"))
+        store = EmbeddingStore.load(os.path.join(directory, "vectors.emb"))
+        return cls(lists["centroids"], lists["offsets"], store, int(lists["nprobe"]))
+
+
+@dataclass
+class SearchResults:
+    """Mirrors the ``.results`` of a Cortex Search response."""
+    results: list = field(default_factory=list)
+
+
+def cortex_query_embedder(session, model: str = EMBED_MODEL):
+    """Embed query text with Cortex, the same model the chunks were embedded with."""
+    def embed(text: str) -> np.ndarray:
+        row = session.sql(
+            "SELECT SNOWFLAKE.CORTEX.EMBED_TEXT_768(?, ?)::ARRAY AS EMBEDDING", params=[model, text]
+        ).collect()[0]
+        value = row["EMBEDDING"]
+        return np.asarray(json.loads(value) if isinstance(value, str) else value, dtype=np.float32)
+    return embed
+
+
+class LocalSearchService:
+    """An ``IVFIndex`` plus chunk attributes, searchable like a Cortex Search service.
+
+    ``embed_query(text)`` turns the query into a vector; pass a local model's
+    embedder to search with no connection at all. Results carry the
+    requested columns plus ``score`` (cosine similarity).
+    """
+
+    def __init__(self, index: IVFIndex, chunks: dict, embed_query):
+        self.index = index
+        self.chunks = chunks
+        self.embed_query = embed_query
+
+    def search(self, query: str, columns, limit: int = 10, nprobe: int = None, **kwargs) -> SearchResults:
+        # Over-fetch so vectors without chunk attributes (deleted since the build) don't shorten the list
+        ids, scores = self.index.search(self.embed_query(query), k=2 * limit, nprobe=nprobe)
+        results = []
+        for chunk_id, score in zip(ids[0], scores[0]):
+            chunk = self.chunks.get(int(chunk_id))
+            if chunk is not None:
+                results.append({**{c: chunk.get(c) for c in columns}, "score": float(score)})
+        return SearchResults(results[:limit])
+
+    def save(self, directory: str):
+        self.index.save(directory)
+        with open(os.path.join(directory, "chunks.json"), "w", encoding="utf-8") as f:
+            json.dump({str(chunk_id): chunk for chunk_id, chunk in self.chunks.items()}, f)
+
+    @classmethod
+    def load(cls, directory: str, embed_query) -> "LocalSearchService":
+        with open(os.path.join(directory, "chunks.json"), encoding="utf-8") as f:
+            chunks = {int(chunk_id): chunk for chunk_id, chunk in json.load(f).items()}
+        return cls(IVFIndex.load(directory), chunks, embed_query)
+
+
+def local_index_path(service_path: str, directory: str = DEFAULT_DIR) -> str:
+    return os.path.join(os.path.expanduser(directory), service_path.upper())
+
+
+def load_chunk_embeddings(session, embedding_table: str, chunk_table: str, model: str = EMBED_MODEL):
+    """Download live chunks and their embeddings.
+
+    Returns ``(chunks, store)``: attributes by CHUNK_ID, and an
+    ``EmbeddingStore`` of the embeddings of those chunks only.
+    """
+    rows = session.sql(f"""
+        SELECT CHUNK_ID, CHUNK_TEXT, FILE_NAME, CHUNK_TYPE, DOC_ID
+        FROM {chunk_table}
+        WHERE NOT COALESCE(IS_DELETED, FALSE)
+    """).collect()
+    chunks = {int(row["CHUNK_ID"]): row.as_dict() for row in rows}
+    store = EmbeddingStore.from_table(session, embedding_table, model)
+    live = np.flatnonzero(np.isin(store.ids, np.fromiter(chunks, dtype=np.int64, count=len(chunks))))
+    return chunks, EmbeddingStore(store.ids[live], store.vectors[live], model)
+
+
+def build_local_service(session, embedding_table: str, chunk_table: str, nlist: int = None,
+                        nprobe: int = DEFAULT_NPROBE, model: str = EMBED_MODEL) -> LocalSearchService:
+    """Download live chunks and their embeddings and index them."""
+    chunks, store = load_chunk_embeddings(session, embedding_table, chunk_table, model)
+    return LocalSearchService(IVFIndex.build(store, nlist=nlist, nprobe=nprobe), chunks,
+                              cortex_query_embedder(session, model))
+
+
+@lru_cache(maxsize=8)
+def _load_cached(directory: str, modified: float) -> LocalSearchService:
+    return LocalSearchService.load(directory, None)
+
+
+def load_local_service(session, service_path: str, embed_query=None):
+    """The saved local index for ``service_path``, or None; reloaded when its files change.
+
+    Only the ANN search is local: queries are embedded with Cortex through
+    ``session`` unless ``embed_query`` is given. Pass a local model's
+    embedder to search with no connection at all.
+    """
+    directory = local_index_path(service_path)
+    marker = os.path.join(directory, "lists.npz")
+    if not os.path.exists(marker):
+        return None
+    cached = _load_cached(directory, os.path.getmtime(marker))
+    if embed_query is None:
+        embed_query = cortex_query_embedder(session, cached.index.store.model)
+    return LocalSearchService(cached.index, cached.chunks, embed_query)
@@ -0,0 +1,148 @@
+"""Compact local storage for chunk embeddings.
+
+Vectors live in one contiguous float32 matrix next to an int64 array of
+CHUNK_IDs, a fraction of the memory of Python lists of floats. A store is
+saved as a small fixed-size header followed by the raw arrays, so loading
+it memory-maps the file instead of reading it, and slices are views.
+
+File layout: ``header | ids (int64[count]) | vectors (float32[count, dim])``.
+"""
+import json
+import os
+import struct
+
+import numpy as np
+
+from shared.embeddings import EMBED_MODEL
+
+DEFAULT_DIR = "~/.cache/30-days-of-ai/embeddings"
+MAGIC = b"EMBSTOR1"
+HEADER_SIZE = 256
+# Magic, dim, count, then the model name, NUL-padded to the header size
+_HEADER = struct.Struct(f"<8sIQ{HEADER_SIZE - 20}s")
+
+
+def _as_vector(value) -> list:
+    # VECTOR/ARRAY values may come back as JSON text depending on the connector version
+    return json.loads(value) if isinstance(value, str) else value
+
+
+def default_store_path(table: str, directory: str = DEFAULT_DIR) -> str:
+    return os.path.join(os.path.expanduser(directory), f"{table.upper()}.emb")
+
+
+def discard_store(path: str):
+    """Delete a saved store, e.g. once the table it was cached from has been rewritten."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class EmbeddingStore:
+    """CHUNK_IDs plus a float32 ``(count, dim)`` matrix of their embeddings.
+
+    Arrays are used as given when they already have the right dtype and
+    layout, so a memory-mapped store stays memory-mapped. Integer and slice
+    indexing return stores that share memory with this one.
+    """
+
+    def __init__(self, ids, vectors, model: str = EMBED_MODEL):
+        self.ids = np.ascontiguousarray(ids, dtype=np.int64)
+        self.vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if self.vectors.ndim != 2 or len(self.vectors) != len(self.ids):
+            raise ValueError(f"Expected {len(self.ids)} vectors, got an array of shape {self.vectors.shape}")
+        self.model = model
+        self._positions = None
+
+    @classmethod
+    def from_records(cls, ids, vectors, dim: int = None, model: str = EMBED_MODEL) -> "EmbeddingStore":
+        """Build a store from any sequence of vectors, one row at a time."""
+        ids = list(ids)
+        matrix = None
+        for row, vector in enumerate(vectors):
+            vector = _as_vector(vector)
+            if matrix is None:
+                matrix = np.empty((len(ids), dim or len(vector)), dtype=np.float32)
+            matrix[row] = vector
+        if matrix is None:
+            matrix = np.empty((0, dim or 0), dtype=np.float32)
+        return cls(ids, matrix, model)
+
+    @classmethod
+    def from_table(cls, session, table: str, model: str = EMBED_MODEL) -> "EmbeddingStore":
+        """Stream ``CHUNK_ID, EMBEDDING`` rows of an embeddings table into a store."""
+        count = session.sql(f"SELECT COUNT(*) AS CNT FROM {table}").collect()[0]["CNT"]
+        rows = session.sql(
+            f"SELECT CHUNK_ID, EMBEDDING::ARRAY AS EMBEDDING FROM {table} ORDER BY CHUNK_ID"
+        ).to_local_iterator()
+        ids = np.empty(count, dtype=np.int64)
+        matrix = None
+        filled = 0
+        for row in rows:
+            if filled == count:
+                break  # Rows added since the count
+            vector = _as_vector(row["EMBEDDING"])
+            if matrix is None:
+                matrix = np.empty((count, len(vector)), dtype=np.float32)
+            ids[filled] = row["CHUNK_ID"]
+            matrix[filled] = vector
+            filled += 1
+        if matrix is None:
+            matrix = np.empty((0, 0), dtype=np.float32)
+        return cls(ids[:filled], matrix[:filled], model)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index) -> "EmbeddingStore":
+        if isinstance(index, (int, np.integer)):
+            index = slice(index, index + 1 or None)
+        return EmbeddingStore(self.ids[index], self.vectors[index], self.model)
+
+    def vector(self, chunk_id: int) -> np.ndarray:
+        """The embedding of one chunk; raises ``KeyError`` if it isn't stored."""
+        if self._positions is None:
+            self._positions = {int(chunk_id): row for row, chunk_id in enumerate(self.ids)}
+        return self.vectors[self._positions[int(chunk_id)]]
+
+    def append(self, ids, vectors):
+        """Add rows in place; this copies, so a memory-mapped store becomes an in-memory one."""
+        other = EmbeddingStore(ids, np.asarray(vectors, dtype=np.float32).reshape(len(ids), -1), self.model)
+        if len(self) and other.dim != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {other.dim}")
+        self.vectors = np.concatenate([self.vectors, other.vectors]) if len(self) else other.vectors
+        self.ids = np.concatenate([self.ids, other.ids])
+        self._positions = None
+
+    def save(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, self.dim, len(self), self.model.encode("utf-8")))
+            self.ids.tofile(f)
+            self.vectors.tofile(f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "EmbeddingStore":
+        """Open a saved store; with ``mmap`` the arrays are read-only views of the file."""
+        with open(path, "rb") as f:
+            magic, dim, count, model = _HEADER.unpack(f.read(HEADER_SIZE))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an embedding store")
+        model = model.rstrip(b"\0").decode("utf-8")
+        if mmap and count:
+            ids = np.memmap(path, dtype=np.int64, mode="r", offset=HEADER_SIZE, shape=(count,))
+            vectors = np.memmap(path, dtype=np.float32, mode="r", offset=HEADER_SIZE + 8 * count,
+                                shape=(count, dim))
+        else:
+            with open(path, "rb") as f:
+                f.seek(HEADER_SIZE)
+                ids = np.fromfile(f, dtype=np.int64, count=count)
+                vectors = np.fromfile(f, dtype=np.float32, count=count * dim).reshape(count, dim)
+        return cls(ids, vectors, model)